@@ -1,15 +1,93 @@
 # backend/app/auth.py
 from __future__ import annotations
 
+import base64
+import hashlib
+import json
 import os
+import re
+import time
+from collections import OrderedDict
 from typing import Optional, Tuple, Dict, Any
 
 import httpx
-from dotenv import load_dotenv
-from fastapi import Header, HTTPException
+from fastapi import Depends, Header, HTTPException, Request
 
-# Loads .env locally (on Render you typically rely on dashboard env vars)
-load_dotenv()
+try:
+    # PyJWT — локальная проверка подписи Supabase JWT (HS256)
+    import jwt
+
+    _JWT_AVAILABLE = True
+except Exception:  # ImportError — остаёмся на удалённой проверке
+    _JWT_AVAILABLE = False
+    jwt = None  # type: ignore[assignment]
+
+# Loads .env locally only (APP_ENV != prod); in prod env comes from Render /
+# docker env_file, so we skip the dotenv filesystem lookup on cold start.
+if os.getenv("APP_ENV", "prod") != "prod":
+    from dotenv import load_dotenv
+
+    load_dotenv()
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+# ---------- token -> user cache (TTL + LRU) ----------
+# key = sha256(token) -> (expires_at, user dict or None for rejected tokens)
+AUTH_CACHE_TTL = _env_int("AUTH_CACHE_TTL", 60)
+AUTH_CACHE_NEGATIVE_TTL = _env_int("AUTH_CACHE_NEGATIVE_TTL", 5)
+AUTH_CACHE_MAXSIZE = _env_int("AUTH_CACHE_MAXSIZE", 10_000)
+
+_USER_CACHE: "OrderedDict[str, Tuple[float, Optional[Dict[str, Any]]]]" = OrderedDict()
+_MISS = object()
+
+
+def _token_key(token: str) -> str:
+    # не держим сырые токены в памяти процесса
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def _cache_get(key: str) -> Any:
+    entry = _USER_CACHE.get(key)
+    if entry is None:
+        return _MISS
+
+    expires_at, user = entry
+    if expires_at < time.monotonic():
+        _USER_CACHE.pop(key, None)
+        return _MISS
+
+    _USER_CACHE.move_to_end(key)
+    return user
+
+
+def _cache_set(key: str, user: Optional[Dict[str, Any]], ttl: float) -> None:
+    if ttl <= 0:
+        return
+    _USER_CACHE[key] = (time.monotonic() + ttl, user)
+    _USER_CACHE.move_to_end(key)
+    while len(_USER_CACHE) > AUTH_CACHE_MAXSIZE:
+        _USER_CACHE.popitem(last=False)
+
+
+def _token_ttl(token: str) -> float:
+    """
+    AUTH_CACHE_TTL, capped at the token's own `exp`: a cached user must not
+    outlive the JWT. Claims are read without verification — Supabase has
+    just accepted this token; unreadable claims -> no cap.
+    """
+    try:
+        payload = token.split(".")[1]
+        claims = json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+        exp = float(claims["exp"])
+    except Exception:
+        return AUTH_CACHE_TTL
+    return min(AUTH_CACHE_TTL, exp - time.time())
 
 
 def _clean_env(value: Optional[str]) -> Optional[str]:
@@ -22,7 +100,7 @@ def _clean_env(value: Optional[str]) -> Optional[str]:
     return v or None
 
 
-def _get_supabase_env() -> Tuple[str, str]:
+def _resolve_supabase_env() -> Tuple[Optional[str], Optional[str]]:
     # Accept multiple possible names (backend should prefer SUPABASE_URL)
     supabase_url = (
         os.getenv("SUPABASE_URL")
@@ -41,59 +119,166 @@ def _get_supabase_env() -> Tuple[str, str]:
     )
     api_key = _clean_env(api_key)
 
-    if not supabase_url or not api_key:
-        raise HTTPException(
-            status_code=500,
-            detail=(
-                "Server misconfigured: SUPABASE_URL (or NEXT_PUBLIC_SUPABASE_URL) and one of "
-                "[SUPABASE_ANON_KEY | SUPABASE_SERVICE_ROLE_KEY | NEXT_PUBLIC_SUPABASE_ANON_KEY] must be set"
-            ),
+    return supabase_url, api_key
+
+
+def _resolve_auth_mode() -> str:
+    """
+    AUTH_MODE:
+    - local  — only verify the JWT signature with SUPABASE_JWT_SECRET
+    - remote — always ask Supabase /auth/v1/user
+    - hybrid — local when possible, remote for other algorithms or when the secret is unset
+    """
+    mode = (_clean_env(os.getenv("AUTH_MODE")) or "hybrid").lower()
+    return mode if mode in {"local", "remote", "hybrid"} else "hybrid"
+
+
+# Env is read once at import: on Render changing it requires a redeploy anyway.
+_SUPABASE_URL, _SUPABASE_KEY = _resolve_supabase_env()
+_SUPABASE_USER_URL = f"{_SUPABASE_URL.rstrip('/')}/auth/v1/user" if _SUPABASE_URL else None
+_SUPABASE_JWT_SECRET = _clean_env(os.getenv("SUPABASE_JWT_SECRET"))
+_AUTH_MODE = _resolve_auth_mode()
+_LOCAL_JWT_ENABLED = _JWT_AVAILABLE and bool(_SUPABASE_JWT_SECRET)
+
+
+def check_auth_config() -> None:
+    """
+    Fail fast on startup (called from the lifespan in backend/app/main.py)
+    instead of answering 500 on every authenticated request.
+    """
+    if _AUTH_MODE == "local":
+        if not _LOCAL_JWT_ENABLED:
+            raise RuntimeError("AUTH_MODE=local requires PyJWT and SUPABASE_JWT_SECRET to be set.")
+        return
+
+    if not _SUPABASE_URL or not _SUPABASE_KEY:
+        raise RuntimeError(
+            "Server misconfigured: SUPABASE_URL (or NEXT_PUBLIC_SUPABASE_URL) and one of "
+            "[SUPABASE_ANON_KEY | SUPABASE_SERVICE_ROLE_KEY | NEXT_PUBLIC_SUPABASE_ANON_KEY] must be set"
         )
 
-    return supabase_url, api_key
+
+# "Bearer <token>" за один проход; пустой токен -> group(1) == ""
+_BEARER_RE = re.compile(r"^Bearer(?:\s+(\S*))?\s*$", re.IGNORECASE)
 
 
-async def _fetch_supabase_user(authorization: Optional[str]) -> Dict[str, Any]:
+def get_supabase_http(request: Request) -> httpx.AsyncClient:
+    """Shared AsyncClient created in the app lifespan (backend/app/main.py)."""
+    return request.app.state.supabase_http
+
+
+def _decode_local_user(token: str, secret: str) -> Optional[Dict[str, Any]]:
+    """
+    Verify an HS256 Supabase JWT locally (no network).
+    Returns None when the token is signed with another algorithm (e.g. RS256)
+    so the caller can fall back to the remote check.
+    """
+    try:
+        if jwt.get_unverified_header(token).get("alg") != "HS256":
+            return None
+        payload = jwt.decode(token, secret, algorithms=["HS256"], audience="authenticated")
+    except jwt.PyJWTError:
+        raise HTTPException(status_code=401, detail="Invalid/expired token")
+
+    if not payload.get("sub"):
+        raise HTTPException(status_code=401, detail="User id not found in token")
+
+    # та же форма, что и у ответа /auth/v1/user
+    return {
+        "id": payload["sub"],
+        "email": payload.get("email"),
+        "role": payload.get("role"),
+        "user_metadata": payload.get("user_metadata") or {},
+        "app_metadata": payload.get("app_metadata") or {},
+    }
+
+
+async def _fetch_supabase_user(
+    authorization: Optional[str],
+    client: httpx.AsyncClient,
+) -> Dict[str, Any]:
     if not authorization:
         raise HTTPException(status_code=401, detail="Missing Authorization header")
 
-    if not authorization.lower().startswith("bearer "):
+    m = _BEARER_RE.match(authorization)
+    if m is None:
         raise HTTPException(status_code=401, detail="Authorization must be Bearer token")
 
-    token = authorization.split(" ", 1)[1].strip()
+    token = m.group(1)
     if not token:
         raise HTTPException(status_code=401, detail="Empty Bearer token")
 
-    supabase_url, api_key = _get_supabase_env()
-    url = f"{supabase_url.rstrip('/')}/auth/v1/user"
+    if _AUTH_MODE != "remote" and _LOCAL_JWT_ENABLED:
+        user = _decode_local_user(token, _SUPABASE_JWT_SECRET)
+        if user is not None:
+            return user
+        if _AUTH_MODE == "local":
+            raise HTTPException(status_code=401, detail="Unsupported token algorithm")
+
+    key = _token_key(token)
+    cached = _cache_get(key)
+    if cached is not _MISS:
+        if cached is None:
+            raise HTTPException(status_code=401, detail="Invalid/expired token")
+        return cached
 
     try:
-        async with httpx.AsyncClient(timeout=10) as client:
-            r = await client.get(
-                url,
-                headers={
-                    "Authorization": f"Bearer {token}",
-                    "apikey": api_key,
-                },
-            )
+        r = await client.get(
+            _SUPABASE_USER_URL,
+            headers={
+                "Authorization": f"Bearer {token}",
+                "apikey": _SUPABASE_KEY,
+            },
+        )
     except httpx.RequestError:
         raise HTTPException(status_code=502, detail="Failed to reach Supabase Auth service")
 
+    if r.status_code in (401, 403):
+        # короткий negative cache, чтобы мусорные токены не долбили Supabase
+        _cache_set(key, None, AUTH_CACHE_NEGATIVE_TTL)
+        raise HTTPException(status_code=401, detail="Invalid/expired token")
     if r.status_code != 200:
         raise HTTPException(status_code=401, detail="Invalid/expired token")
 
     data = r.json()
     if not data.get("id"):
         raise HTTPException(status_code=401, detail="User id not found in token")
+
+    _cache_set(key, data, _token_ttl(token))
     return data
 
 
-async def get_current_user(authorization: Optional[str] = Header(None)) -> Dict[str, Any]:
+async def get_current_user(
+    request: Request,
+    authorization: Optional[str] = Header(None),
+    client: httpx.AsyncClient = Depends(get_supabase_http),
+) -> Dict[str, Any]:
     """يرجع dict فيه id + email ... الخ"""
-    return await _fetch_supabase_user(authorization)
+    # مرة واحدة لكل request: النتيجة تُحفظ في request.state.user
+    user = getattr(request.state, "user", None)
+    if user is None:
+        user = await _fetch_supabase_user(authorization, client)
+        request.state.user = user
+    return user
+
+
+async def get_optional_user_id(
+    request: Request,
+    authorization: Optional[str] = Header(None),
+) -> Optional[str]:
+    """
+    For public endpoints (/ai): no Authorization header -> None (anonymous),
+    otherwise the same check as get_current_user (a bad token is still 401).
+    """
+    if not authorization:
+        return None
+    user = getattr(request.state, "user", None)
+    if user is None:
+        user = await _fetch_supabase_user(authorization, get_supabase_http(request))
+        request.state.user = user
+    return user["id"]
 
 
-async def get_current_user_id(authorization: Optional[str] = Header(None)) -> str:
+async def get_current_user_id(user: Dict[str, Any] = Depends(get_current_user)) -> str:
     """للتوافق: يرجع UUID فقط."""
-    data = await _fetch_supabase_user(authorization)
-    return data["id"]
+    return user["id"]
@@ -12,7 +12,7 @@ import logging
 
 from fastapi import FastAPI, Request
 from fastapi.exceptions import RequestValidationError
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse
 from starlette.exceptions import HTTPException as StarletteHTTPException
 
 logger = logging.getLogger(__name__)
@@ -50,7 +50,7 @@ def _build_error_payload(
 async def http_exception_handler(
     request: Request,
     exc: StarletteHTTPException,
-) -> JSONResponse:
+) -> ORJSONResponse:
     """
     Обработчик "обычных" HTTP-ошибок (HTTPException).
 
@@ -72,38 +72,40 @@ async def http_exception_handler(
         code="HTTP_EXCEPTION",
         details=None,
     )
-    return JSONResponse(status_code=exc.status_code, content=payload)
+    return ORJSONResponse(status_code=exc.status_code, content=payload)
 
 
 async def validation_exception_handler(
     request: Request,
     exc: RequestValidationError,
-) -> JSONResponse:
+) -> ORJSONResponse:
     """
     Обработка ошибок валидации входных данных (Pydantic/FastAPI).
 
     Например, если в body не хватает обязательного поля.
     """
+    # errors() считаем один раз — и для лога, и для ответа
+    errors = exc.errors()
     logger.warning(
         "Validation error on %s %s: %s",
         request.method,
         request.url,
-        exc.errors(),
+        errors,
     )
 
     payload = _build_error_payload(
         status_code=422,
         message="Ошибка валидации входных данных",
         code="VALIDATION_ERROR",
-        details=exc.errors(),
+        details=errors,
     )
-    return JSONResponse(status_code=422, content=payload)
+    return ORJSONResponse(status_code=422, content=payload)
 
 
 async def generic_exception_handler(
     request: Request,
     exc: Exception,
-) -> JSONResponse:
+) -> ORJSONResponse:
     """
     "Последняя линия защиты" — перехватывает любые необработанные исключения.
     Пользователь видит аккуратный 500-ответ, а детали ошибки уходят в лог.
@@ -123,7 +125,7 @@ async def generic_exception_handler(
         code="INTERNAL_SERVER_ERROR",
         details=None,
     )
-    return JSONResponse(status_code=500, content=payload)
+    return ORJSONResponse(status_code=500, content=payload)
 
 
 def init_exception_handlers(app: FastAPI) -> None:
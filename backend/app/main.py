@@ -1,11 +1,22 @@
 # backend/app/main.py
 import os
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
 
-from fastapi import FastAPI
+import httpx
+from fastapi import Depends, FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 
 from backend.db import init_db
+from ml.service.batching import BatchingFlashcardsQueue
+from .auth import check_auth_config, get_current_user
 from .routers import ai, decks, review, stats
+from .routers.ai import (
+    build_flashcards_service,
+    build_openai_client,
+    load_ocr_config,
+)
 from .exceptions import init_exception_handlers
 
 
@@ -27,10 +38,46 @@ def get_allowed_origins() -> list[str]:
     return origins
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    """
+    Startup/shutdown: init DB + shared clients for Supabase Auth and OpenAI
+    (keep-alive connections instead of a new TCP/TLS handshake per request).
+    """
+    check_auth_config()
+    init_db()
+    # HTTP/2: many /auth/v1/user calls multiplexed over one TCP connection
+    app.state.supabase_http = httpx.AsyncClient(
+        http2=True,
+        timeout=httpx.Timeout(connect=5.0, read=10.0, write=10.0, pool=5.0),
+        limits=httpx.Limits(
+            max_connections=int(os.getenv("HTTPX_MAX_CONN", "256")),
+            max_keepalive_connections=int(os.getenv("HTTPX_KEEPALIVE", "64")),
+            keepalive_expiry=30.0,
+        ),
+    )
+    app.state.ocr_cfg = load_ocr_config()
+    app.state.openai = build_openai_client(app.state.ocr_cfg)
+    # per-worker flashcards cache + request coalescing (see routers/ai.get_flashcards_queue)
+    app.state.flashcards_service = build_flashcards_service()
+    app.state.flashcards_queue = BatchingFlashcardsQueue(app.state.flashcards_service)
+    app.state.flashcards_queue.start()
+    try:
+        yield
+    finally:
+        await app.state.flashcards_queue.stop()
+        app.state.flashcards_service.close()
+        await app.state.supabase_http.aclose()
+        if app.state.openai is not None:
+            await app.state.openai.close()
+
+
 app = FastAPI(
     title="Auto-Flashcards API",
     description="MVP прототип backend-сервиса для проекта Auto-Flashcards (роль: Fullstack)",
     version="0.1.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
 
 # CORS
@@ -45,11 +92,6 @@ app.add_middleware(
 init_exception_handlers(app)
 
 
-@app.on_event("startup")
-def on_startup() -> None:
-    init_db()
-
-
 @app.get("/", tags=["system"])
 async def root() -> dict:
     return {"status": "ok", "service": "Auto-Flashcards API"}
@@ -62,6 +104,8 @@ async def health_check() -> dict:
 
 # Routers
 app.include_router(ai.router, prefix="/ai", tags=["ai"])
-app.include_router(decks.router, prefix="/decks", tags=["decks"])
-app.include_router(review.router, prefix="/review", tags=["review"])
-app.include_router(stats.router, prefix="/stats", tags=["stats"])
+# Auth once per router; handlers reuse the resolved user (request.state.user)
+_auth = [Depends(get_current_user)]
+app.include_router(decks.router, prefix="/decks", tags=["decks"], dependencies=_auth)
+app.include_router(review.router, prefix="/review", tags=["review"], dependencies=_auth)
+app.include_router(stats.router, prefix="/stats", tags=["stats"], dependencies=_auth)
@@ -2,17 +2,32 @@
 
 from __future__ import annotations
 
+import asyncio
 import base64
+import hashlib
+import logging
 import os
-from io import BytesIO
-from typing import List, Optional
-
-from fastapi import APIRouter, HTTPException, UploadFile, File, Form
-from openai import OpenAI
-
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple, Union
+
+import httpx
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, UploadFile, File, Form
+from openai import AsyncOpenAI
+
+from backend.app.auth import get_optional_user_id
+from backend.app.utils.file_text import (
+    KIND_BY_EXT,
+    KIND_PRIORITY,
+    TEXT_EXTS,
+    extract_text,
+    guess_ext as _guess_ext,
+    mime_kind,
+)
+from ml.service.batching import BatchingFlashcardsQueue
 from ml.service.flashcards_service import (
-    flashcards_service,
     FlashcardsRequest,
+    FlashcardsService,
 )
 from ml.api.schemas import (
     Flashcard,
@@ -21,11 +36,19 @@ from ml.api.schemas import (
 )
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 
 # --------- helpers: extract text from uploads (txt/pdf/docx) ---------
 
-def _safe_limit_text(text: str, max_chars: int = 20000) -> str:
+TEXT_MAX_CHARS = 20000
+
+# Жёсткий лимит на размер загрузки: 413 вместо OOM.
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(20 * 1024 * 1024)))
+_UPLOAD_CHUNK_BYTES = 64 * 1024
+
+
+def _safe_limit_text(text: str, max_chars: int = TEXT_MAX_CHARS) -> str:
     """Avoid sending extremely long texts into the model/service."""
     text = (text or "").strip()
     if len(text) > max_chars:
@@ -33,13 +56,6 @@ def _safe_limit_text(text: str, max_chars: int = 20000) -> str:
     return text
 
 
-def _guess_ext(filename: str) -> str:
-    name = (filename or "").lower().strip()
-    if "." in name:
-        return name.rsplit(".", 1)[-1]
-    return ""
-
-
 def _env_bool(name: str, default: bool) -> bool:
     raw = os.getenv(name)
     if raw is None:
@@ -66,42 +82,156 @@ _IMAGE_MIME_BY_EXT = {
 }
 
 
-def _get_openai_key() -> str:
-    api_key = _clean_env_value(os.getenv("OPENAI_API_KEY"))
-    if not api_key:
-        raise HTTPException(
-            status_code=500,
-            detail="OPENAI_API_KEY is not set; image OCR is unavailable.",
-        )
-    return api_key
+@dataclass(frozen=True)
+class OCRConfig:
+    """OCR settings resolved once at startup (stored on app.state.ocr_cfg)."""
+    enabled: bool
+    api_key: Optional[str]
+    model: str
+    timeout_sec: float
+
+
+def load_ocr_config() -> OCRConfig:
+    cfg = OCRConfig(
+        enabled=_env_bool("LLM_ENABLED", True),
+        api_key=_clean_env_value(os.getenv("OPENAI_API_KEY")),
+        model=(
+            _clean_env_value(os.getenv("OPENAI_OCR_MODEL"))
+            or _clean_env_value(os.getenv("OPENAI_MODEL"))
+            or "gpt-4o-mini"
+        ),
+        timeout_sec=float(os.getenv("OPENAI_TIMEOUT_SEC", "30.0")),
+    )
+    if cfg.enabled and not cfg.api_key:
+        logger.warning("OPENAI_API_KEY is not set; image OCR is unavailable.")
+    return cfg
+
+
+def build_openai_client(cfg: OCRConfig) -> Optional[AsyncOpenAI]:
+    """
+    One AsyncOpenAI per app (created in the lifespan, backend/app/main.py).
+    Returns None when OPENAI_API_KEY is not set — OCR then answers 500.
+    """
+    if not cfg.api_key:
+        return None
+    return AsyncOpenAI(
+        api_key=cfg.api_key,
+        timeout=cfg.timeout_sec,
+        max_retries=2,
+        http_client=httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=50, max_keepalive_connections=20),
+        ),
+    )
+
+
+def get_openai_client(request: Request) -> Optional[AsyncOpenAI]:
+    return getattr(request.app.state, "openai", None)
 
 
-def _get_openai_model() -> str:
-    return (
-        _clean_env_value(os.getenv("OPENAI_OCR_MODEL"))
-        or _clean_env_value(os.getenv("OPENAI_MODEL"))
-        or "gpt-4o-mini"
+def get_ocr_config(request: Request) -> OCRConfig:
+    return getattr(request.app.state, "ocr_cfg", None) or load_ocr_config()
+
+
+# --------- flashcards service: one per worker, created in the lifespan ---------
+
+def build_flashcards_service() -> FlashcardsService:
+    """
+    FlashcardsService (in-memory cache + single-flight) for this worker process.
+    Stored on app.state.flashcards_service; stopped on shutdown.
+
+    The cache is shared by the request threads and the service's sweeper
+    thread; FlashcardsService serializes access with its own _cache_lock.
+    It is not shared across uvicorn workers — each process has its own.
+    """
+    return FlashcardsService(
+        cache_ttl_seconds=int(os.getenv("FLASHCARDS_CACHE_TTL_SEC", "60")),
+        max_entries=int(os.getenv("FLASHCARDS_CACHE_MAX_ENTRIES", "1024")),
     )
 
 
-def _extract_text_from_image(raw: bytes, mime_type: str) -> str:
-    if not _env_bool("LLM_ENABLED", True):
+def get_flashcards_service(request: Request) -> FlashcardsService:
+    service = getattr(request.app.state, "flashcards_service", None)
+    if service is None:
+        # app without lifespan (e.g. TestClient(app) outside `with`) — create on first use
+        service = request.app.state.flashcards_service = build_flashcards_service()
+    return service
+
+
+def get_flashcards_queue(request: Request) -> BatchingFlashcardsQueue:
+    """Coalesces concurrent /generate requests; the consumer is started in the lifespan."""
+    queue = getattr(request.app.state, "flashcards_queue", None)
+    if queue is None:
+        queue = BatchingFlashcardsQueue(get_flashcards_service(request))
+        request.app.state.flashcards_queue = queue
+    return queue
+
+
+# --------- OCR cache: identical image bytes -> extracted text ---------
+# key = blake2b(raw):mime -> (expires_at by time.monotonic(), text | (status_code, detail)
+# of a recent failure); a fresh HTTPException is raised per request, never a shared one
+
+OCR_CACHE_TTL_SEC = int(os.getenv("OCR_CACHE_TTL_SEC", "3600"))
+OCR_CACHE_FAILURE_TTL_SEC = int(os.getenv("OCR_CACHE_FAILURE_TTL_SEC", "10"))
+OCR_CACHE_MAXSIZE = int(os.getenv("OCR_CACHE_MAXSIZE", "1024"))
+
+_OCR_CACHE: Dict[str, Tuple[float, Union[str, Tuple[int, str]]]] = {}
+
+
+def _ocr_cache_get(key: str) -> Optional[Union[str, Tuple[int, str]]]:
+    entry = _OCR_CACHE.get(key)
+    if not entry:
+        return None
+
+    expires_at, value = entry
+    if expires_at < time.monotonic():
+        _OCR_CACHE.pop(key, None)
+        return None
+
+    return value
+
+
+def _ocr_cache_set(key: str, value: Union[str, Tuple[int, str]], ttl: int) -> None:
+    _OCR_CACHE.pop(key, None)
+    _OCR_CACHE[key] = (time.monotonic() + ttl, value)
+    while len(_OCR_CACHE) > OCR_CACHE_MAXSIZE:
+        _OCR_CACHE.pop(next(iter(_OCR_CACHE)))
+
+
+async def _extract_text_from_image(
+    raw: bytes,
+    mime_type: str,
+    client: Optional[AsyncOpenAI],
+    cfg: OCRConfig,
+) -> str:
+    if not cfg.enabled:
         raise HTTPException(
             status_code=400,
             detail="LLM is disabled (LLM_ENABLED=0); image OCR is unavailable.",
         )
 
-    api_key = _get_openai_key()
-    model = _get_openai_model()
-    timeout_sec = float(os.getenv("OPENAI_TIMEOUT_SEC", "30.0"))
+    if client is None:
+        raise HTTPException(
+            status_code=500,
+            detail="OPENAI_API_KEY is not set; image OCR is unavailable.",
+        )
 
-    data_url = f"data:{mime_type};base64,{base64.b64encode(raw).decode('ascii')}"
+    # повторная отправка той же картинки не идёт в OpenAI второй раз;
+    # недавняя ошибка тоже кэшируется (коротко), чтобы не долбить модель ретраями
+    cache_key = f"{hashlib.blake2b(raw, digest_size=16).hexdigest()}:{mime_type}"
+    cached = _ocr_cache_get(cache_key)
+    if isinstance(cached, tuple):
+        status_code, detail = cached
+        raise HTTPException(status_code=status_code, detail=detail)
+    if cached is not None:
+        return cached
+
+    # один bytes-буфер + одно декодирование вместо цепочки промежуточных str
+    data_url = (f"data:{mime_type};base64,".encode("ascii") + base64.b64encode(raw)).decode("ascii")
     prompt = "Extract all readable text from this image. Return plain text only."
 
     try:
-        client = OpenAI(api_key=api_key, timeout=timeout_sec)
-        resp = client.chat.completions.create(
-            model=model,
+        resp = await client.chat.completions.create(
+            model=cfg.model,
             messages=[
                 {
                     "role": "user",
@@ -113,86 +243,159 @@ def _extract_text_from_image(raw: bytes, mime_type: str) -> str:
             ],
         )
     except Exception as exc:
-        raise HTTPException(
-            status_code=502,
-            detail=f"Image OCR failed via OpenAI: {exc}",
-        )
+        detail = f"Image OCR failed via OpenAI: {exc}"
+        _ocr_cache_set(cache_key, (502, detail), OCR_CACHE_FAILURE_TTL_SEC)
+        raise HTTPException(status_code=502, detail=detail)
 
-    return (resp.choices[0].message.content or "").strip()
+    text = (resp.choices[0].message.content or "").strip()
+    _ocr_cache_set(cache_key, text, OCR_CACHE_TTL_SEC)
+    return text
 
 
-async def _extract_text_from_upload(file: UploadFile) -> str:
+async def _read_upload(file: UploadFile, stop_at: Optional[int] = None) -> Tuple[bytes, str]:
     """
-    Extract text from UploadFile (txt/pdf/docx).
+    Read the upload in chunks instead of one file.read(), hashing on the fly.
+    stop_at — stop early once enough bytes are buffered (rest is truncated anyway);
+    otherwise the whole file is read, but never more than MAX_UPLOAD_BYTES.
+    Returns (raw bytes, blake2b hex digest of those bytes).
+    """
+    buf = bytearray()
+    digest = hashlib.blake2b(digest_size=16)
+    while chunk := await file.read(_UPLOAD_CHUNK_BYTES):
+        buf.extend(chunk)
+        digest.update(chunk)
+        if stop_at is not None and len(buf) >= stop_at:
+            break
+        if len(buf) > MAX_UPLOAD_BYTES:
+            raise HTTPException(
+                status_code=413,
+                detail=f"File is too large (limit {MAX_UPLOAD_BYTES} bytes).",
+            )
+    return bytes(buf), digest.hexdigest()
+
+
+def _is_text_upload(file: UploadFile) -> bool:
+    content_type = (file.content_type or "").lower()
+    ext = _guess_ext(file.filename or "")
+    return content_type.startswith("text/") or ext in TEXT_EXTS
+
+
+def _upload_read_limit(file: UploadFile) -> Optional[int]:
+    # для текста хватает ~4 байт UTF-8 на символ лимита
+    return TEXT_MAX_CHARS * 4 if _is_text_upload(file) else None
+
+
+# --------- content-addressed cache for /generate-file ---------
+# key = file:{blake2b(raw)}:{max_cards} -> (expires_at by time.monotonic(), response)
+
+FILE_CACHE_TTL_SEC = int(os.getenv("FILE_CACHE_TTL_SEC", str(24 * 60 * 60)))
+FILE_CACHE_MAXSIZE = int(os.getenv("FILE_CACHE_MAXSIZE", "512"))
+
+_FILE_CACHE: Dict[str, Tuple[float, GenerateFlashcardsResponse]] = {}
+
+
+def _file_cache_get(key: str) -> Optional[GenerateFlashcardsResponse]:
+    entry = _FILE_CACHE.get(key)
+    if not entry:
+        return None
+
+    expires_at, response = entry
+    if expires_at < time.monotonic():
+        _FILE_CACHE.pop(key, None)
+        return None
+
+    return response
+
+
+def _file_cache_set(key: str, response: GenerateFlashcardsResponse) -> None:
+    _FILE_CACHE.pop(key, None)
+    _FILE_CACHE[key] = (time.monotonic() + FILE_CACHE_TTL_SEC, response)
+    # dict хранит порядок вставки — выкидываем самые старые записи
+    while len(_FILE_CACHE) > FILE_CACHE_MAXSIZE:
+        _FILE_CACHE.pop(next(iter(_FILE_CACHE)))
+
+
+async def _handle_image(
+    raw: bytes,
+    content_type: str,
+    ext: str,
+    client: Optional[AsyncOpenAI],
+    cfg: OCRConfig,
+) -> str:
+    # OCR via OpenAI
+    mime_type = (
+        content_type
+        if content_type.startswith("image/")
+        else _IMAGE_MIME_BY_EXT.get(ext, "image/png")
+    )
+    return await _extract_text_from_image(raw, mime_type, client, cfg)
+
+
+# Таблицы диспетчеризации — из utils/file_text.py (docx > pdf > text) плюс картинки:
+# если MIME и расширение указывают на разные типы, побеждает более приоритетный.
+_KIND_PRIORITY = {**KIND_PRIORITY, "image": len(KIND_PRIORITY)}
+
+_KIND_BY_EXT = {
+    **KIND_BY_EXT,
+    **{e: "image" for e in _IMAGE_MIME_BY_EXT},
+}
+
+
+def _mime_kind(content_type: str) -> Optional[str]:
+    kind = mime_kind(content_type)
+    if kind is None and content_type.startswith("image/"):
+        kind = "image"
+    return kind
+
+
+async def _extract_text_from_upload(
+    file: UploadFile,
+    raw: bytes,
+    openai_client: Optional[AsyncOpenAI],
+    ocr_cfg: OCRConfig,
+    digest: Optional[str] = None,
+) -> str:
+    """
+    Extract text from an already-read upload (txt/pdf/docx/images).
+    txt/pdf/docx — utils/file_text.extract_text (в потоке), картинки — OCR.
     Raises 415 for unsupported types.
     """
-    raw = await file.read()
     if not raw:
         return ""
 
     content_type = (file.content_type or "").lower()
     ext = _guess_ext(file.filename or "")
 
-    # DOCX
-    if content_type in {
-        "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-        "application/msword",
-    } or ext == "docx":
-        try:
-            from docx import Document  # python-docx
-        except Exception as exc:
-            raise HTTPException(
-                status_code=500,
-                detail=f"python-docx is not installed/available: {exc}",
-            )
+    kinds = [k for k in (_mime_kind(content_type), _KIND_BY_EXT.get(ext)) if k is not None]
+    if not kinds:
+        raise HTTPException(
+            status_code=415,
+            detail=(
+                "Unsupported file type. Supported: txt/pdf/docx and images (png/jpg/jpeg/webp). "
+                f"content_type={file.content_type}, filename={file.filename}"
+            ),
+        )
 
-        doc = Document(BytesIO(raw))
-        parts = [p.text.strip() for p in doc.paragraphs if p.text and p.text.strip()]
-        return "\n".join(parts).strip()
+    kind = min(kinds, key=_KIND_PRIORITY.__getitem__)
+    if kind == "image":
+        return await _handle_image(raw, content_type, ext, openai_client, ocr_cfg)
+    # разбор — чистый CPU: в потоке, чтобы не блокировать event loop;
+    # PDF читается постранично, пока не наберётся вдвое больше лимита текста
+    return await asyncio.to_thread(extract_text, raw, kind, TEXT_MAX_CHARS * 2, digest)
 
-    # PDF
-    if content_type == "application/pdf" or ext == "pdf":
-        try:
-            from pypdf import PdfReader
-        except Exception as exc:
-            raise HTTPException(
-                status_code=500,
-                detail=f"pypdf is not installed/available: {exc}",
-            )
 
-        reader = PdfReader(BytesIO(raw))
-        pages_text: List[str] = []
-        for page in reader.pages:
-            try:
-                pages_text.append((page.extract_text() or "").strip())
-            except Exception:
-                pages_text.append("")
-        return "\n".join([t for t in pages_text if t]).strip()
-
-    # Plain text (fallback)
-    if content_type.startswith("text/") or ext in {"txt", "md", "csv", "log"}:
-        return raw.decode("utf-8", errors="replace").strip()
-
-    # Images (OCR via OpenAI)
-    if content_type.startswith("image/") or ext in _IMAGE_MIME_BY_EXT:
-        mime_type = (
-            content_type
-            if content_type.startswith("image/")
-            else _IMAGE_MIME_BY_EXT.get(ext, "image/png")
-        )
-        return _extract_text_from_image(raw, mime_type)
-
-    # Unknown type
-    raise HTTPException(
-        status_code=415,
-        detail=(
-            "Unsupported file type. Supported: txt/pdf/docx and images (png/jpg/jpeg/webp). "
-            f"content_type={file.content_type}, filename={file.filename}"
-        ),
-    )
+# --------- endpoints ---------
 
+# Карточки из FlashcardsService уже нормализованы (baseline._normalize_cards),
+# поэтому повторную валидацию пропускаем; STRICT_RESPONSE=1 — для отладки.
+STRICT_RESPONSE = _env_bool("STRICT_RESPONSE", False)
+
+
+def _build_cards(cards: Sequence[Mapping[str, str]]) -> List[Flashcard]:
+    if STRICT_RESPONSE:
+        return [Flashcard(**card) for card in cards]
+    return [Flashcard.model_construct(**card) for card in cards]
 
-# --------- endpoints ---------
 
 @router.post(
     "/generate",
@@ -201,6 +404,8 @@ async def _extract_text_from_upload(file: UploadFile) -> str:
 )
 async def generate_flashcards_endpoint(
     payload: GenerateFlashcardsRequest,
+    flashcards_queue: BatchingFlashcardsQueue = Depends(get_flashcards_queue),
+    user_id: Optional[str] = Depends(get_optional_user_id),
 ) -> GenerateFlashcardsResponse:
     text = (payload.text or "").strip()
     if not text:
@@ -209,11 +414,12 @@ async def generate_flashcards_endpoint(
     service_request = FlashcardsRequest(
         text=_safe_limit_text(text),
         max_cards=payload.max_cards,
+        owner=user_id,
     )
 
-    result = flashcards_service.generate(service_request)
+    result = await flashcards_queue.submit(service_request)
 
-    cards_models: List[Flashcard] = [Flashcard(**card) for card in result.cards]
+    cards_models = _build_cards(result.cards)
 
     return GenerateFlashcardsResponse(
         cards=cards_models,
@@ -230,8 +436,22 @@ async def generate_flashcards_endpoint(
 async def generate_flashcards_from_file_endpoint(
     file: UploadFile = File(...),
     max_cards: int = Form(5),
+    refresh: bool = Query(False, description="Игнорировать кэш по хэшу файла"),
+    openai_client: Optional[AsyncOpenAI] = Depends(get_openai_client),
+    ocr_cfg: OCRConfig = Depends(get_ocr_config),
+    flashcards_queue: BatchingFlashcardsQueue = Depends(get_flashcards_queue),
+    user_id: Optional[str] = Depends(get_optional_user_id),
 ) -> GenerateFlashcardsResponse:
-    extracted = await _extract_text_from_upload(file)
+    raw, digest = await _read_upload(file, stop_at=_upload_read_limit(file))
+
+    # тот же файл + тот же max_cards -> отдаём из кэша без парсинга и LLM
+    cache_key = f"file:{digest}:{max_cards}"
+    if not refresh:
+        cached = _file_cache_get(cache_key)
+        if cached is not None:
+            return cached.model_copy(update={"cached": True, "latency_ms": 0.0})
+
+    extracted = await _extract_text_from_upload(file, raw, openai_client, ocr_cfg, digest)
     extracted = (extracted or "").strip()
 
     if not extracted:
@@ -243,13 +463,17 @@ async def generate_flashcards_from_file_endpoint(
     service_request = FlashcardsRequest(
         text=_safe_limit_text(extracted),
         max_cards=max_cards,
+        owner=user_id,
     )
 
-    result = flashcards_service.generate(service_request)
-    cards_models: List[Flashcard] = [Flashcard(**card) for card in result.cards]
+    result = await flashcards_queue.submit(service_request)
+    cards_models = _build_cards(result.cards)
 
-    return GenerateFlashcardsResponse(
+    response = GenerateFlashcardsResponse(
         cards=cards_models,
         cached=result.cached,
         latency_ms=result.latency_ms,
     )
+    if cards_models:
+        _file_cache_set(cache_key, response)
+    return response
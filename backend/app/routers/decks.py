@@ -1,15 +1,28 @@
 # backend/app/routers/decks.py
 from __future__ import annotations
 
+import os
+from collections import OrderedDict
 from datetime import date
-from typing import List, Optional, Dict, Any
+from typing import Any, Dict, Iterator, List, Optional
 
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import ORJSONResponse, StreamingResponse
+import orjson
 from pydantic import BaseModel, ConfigDict, Field
-from sqlalchemy.orm import Session, selectinload
+from sqlalchemy import delete, insert, text
+from sqlalchemy.orm import Session, selectinload, undefer_group
 
 from backend.app.auth import get_current_user
-from backend.db import get_db, Deck as DeckORM, Card as CardORM, User as UserORM
+from backend.app.routers.stats import invalidate_stats
+from backend.db import (
+    SessionLocal,
+    get_db,
+    Deck as DeckORM,
+    Card as CardORM,
+    CardSRS as CardSRSORM,
+    User as UserORM,
+)
 
 router = APIRouter()
 
@@ -34,6 +47,10 @@ class Card(CardCreate):
     srs: Optional[CardSRS] = None
 
 
+class CardBulkCreate(BaseModel):
+    cards: List[CardCreate] = Field(..., min_length=1, max_length=500)
+
+
 class DeckCreate(BaseModel):
     title: str = Field(..., min_length=1, max_length=200)
     description: Optional[str] = Field(default=None, max_length=2000)
@@ -45,66 +62,204 @@ class Deck(DeckCreate):
     cards: List[Card] = Field(default_factory=list)
 
 
+# Read-endpoints отдают ORJSONResponse напрямую: без response_model FastAPI
+# не гоняет результат через jsonable_encoder + повторную валидацию.
+# Схема для OpenAPI остаётся через responses=...
+
+# Данные из БД доверенные — собираем модели через model_construct (без валидаторов).
+
+def _srs_to_model(srs: Optional[CardSRSORM]) -> Optional[CardSRS]:
+    if srs is None:
+        return None
+    return CardSRS.model_construct(
+        interval=srs.interval,
+        repetitions=srs.repetitions,
+        ease_factor=srs.ease_factor,
+        next_review=srs.next_review,
+        last_grade=srs.last_grade,
+    )
+
+
+def _card_to_model(card: CardORM) -> Card:
+    return Card.model_construct(
+        id=card.id,
+        question=card.question,
+        answer=card.answer,
+        srs=_srs_to_model(card.srs),
+    )
+
+
+def _deck_to_model(deck: DeckORM) -> Deck:
+    return Deck.model_construct(
+        id=deck.id,
+        title=deck.title,
+        description=deck.description,
+        cards=[_card_to_model(c) for c in deck.cards],
+    )
+
+
+def _deck_json(deck: DeckORM) -> Dict[str, Any]:
+    return _deck_to_model(deck).model_dump(mode="json")
+
+
+def _card_json(card: CardORM) -> Dict[str, Any]:
+    return _card_to_model(card).model_dump(mode="json")
+
+
+# Supabase uid -> public.users.id. Связка не меняется, поэтому повторный
+# create_deck не ходит в users за каждым новым deck.
+USER_ID_CACHE_MAXSIZE = int(os.getenv("USER_ID_CACHE_MAXSIZE", "10000"))
+
+USER_ID_CACHE: "OrderedDict[str, int]" = OrderedDict()
+
+
+def _public_user_id(db: Session, uid: str, email: str, full_name: Optional[str]) -> int:
+    public_id = USER_ID_CACHE.get(uid)
+    if public_id is not None:
+        USER_ID_CACHE.move_to_end(uid)
+        return public_id
+    return _ensure_public_user(db, email=email, full_name=full_name).id
+
+
+def _remember_public_user_id(uid: str, public_id: int) -> None:
+    # вызывать только после commit: только что вставленный users.id
+    # не должен попасть в кэш, если транзакция откатится
+    USER_ID_CACHE[uid] = public_id
+    USER_ID_CACHE.move_to_end(uid)
+    while len(USER_ID_CACHE) > USER_ID_CACHE_MAXSIZE:
+        USER_ID_CACHE.popitem(last=False)
+
+
 def _ensure_public_user(db: Session, email: str, full_name: Optional[str] = None) -> UserORM:
     user = db.query(UserORM).filter(UserORM.email == email).first()
     if not user:
         user = UserORM(email=email, full_name=full_name)
         db.add(user)
         db.flush()  # يعطي user.id بدون commit كامل
-    else:
-        if full_name and not user.full_name:
-            user.full_name = full_name
-            db.flush()
+    elif full_name and not user.full_name:
+        user.full_name = full_name  # уйдёт вместе с commit вызывающего
     return user
 
 
-def _get_deck_or_404(db: Session, deck_id: int, owner_uid: str) -> DeckORM:
-    deck = (
-        db.query(DeckORM)
-        .options(selectinload(DeckORM.cards).selectinload(CardORM.srs))
-        .filter(DeckORM.id == deck_id, DeckORM.owner_uid == owner_uid)
-        .first()
-    )
+def _get_deck_or_404(db: Session, deck_id: int, owner_uid: str, with_cards: bool = False) -> DeckORM:
+    # with_cards: карточки и их SRS тремя запросами (selectinload), без N+1.
+    # Для проверки владельца перед list_cards/create_card карточки не нужны.
+    query = db.query(DeckORM)
+    if with_cards:
+        query = query.options(
+            selectinload(DeckORM.cards).options(undefer_group("content"), selectinload(CardORM.srs))
+        )
+    deck = query.filter(DeckORM.id == deck_id, DeckORM.owner_uid == owner_uid).first()
     if not deck:
         raise HTTPException(status_code=404, detail="Deck not found")
     return deck
 
 
 def _get_card_or_404(db: Session, deck_id: int, card_id: int, owner_uid: str) -> CardORM:
-    _ = _get_deck_or_404(db, deck_id, owner_uid)
+    # One indexed lookup on (deck_id, id) joined to the owning deck, instead
+    # of loading every card in the deck just to check ownership.
     card = (
         db.query(CardORM)
+        .join(DeckORM, DeckORM.id == CardORM.deck_id)
         .options(selectinload(CardORM.srs))
-        .filter(CardORM.id == card_id, CardORM.deck_id == deck_id)
+        .filter(
+            CardORM.id == card_id,
+            CardORM.deck_id == deck_id,
+            DeckORM.owner_uid == owner_uid,
+        )
         .first()
     )
-    if not card:
+    if card is None:
+        if not db.query(
+            db.query(DeckORM.id)
+            .filter(DeckORM.id == deck_id, DeckORM.owner_uid == owner_uid)
+            .exists()
+        ).scalar():
+            raise HTTPException(status_code=404, detail="Deck not found")
         raise HTTPException(status_code=404, detail="Card not found")
     return card
 
 
-@router.get("/", response_model=List[Deck])
+_LIST_DECKS_SQL = text(
+    """
+    SELECT
+        d.id,
+        d.title,
+        d.description,
+        COALESCE(
+            json_agg(
+                json_build_object(
+                    'id', c.id,
+                    'question', c.question,
+                    'answer', c.answer,
+                    'srs', CASE WHEN s.id IS NULL THEN NULL ELSE json_build_object(
+                        'interval', s."interval",
+                        'repetitions', s.repetitions,
+                        'ease_factor', s.ease_factor_q / 100.0,
+                        'next_review', s.next_review,
+                        'last_grade', s.last_grade
+                    ) END
+                )
+                ORDER BY c.id
+            ) FILTER (WHERE c.id IS NOT NULL),
+            '[]'
+        ) AS cards
+    FROM decks d
+    LEFT JOIN cards c ON c.deck_id = d.id
+    LEFT JOIN card_srs s ON s.card_id = c.id
+    WHERE d.owner_uid = :uid
+    GROUP BY d.id
+    ORDER BY d.id DESC
+    """
+)
+
+
+@router.get("/", responses={200: {"model": List[Deck]}})
 async def list_decks(
     db: Session = Depends(get_db),
     user: Dict[str, Any] = Depends(get_current_user),
-) -> List[Deck]:
-    user_id = user["id"]
-    decks = (
-        db.query(DeckORM)
-        .options(selectinload(DeckORM.cards).selectinload(CardORM.srs))
-        .filter(DeckORM.owner_uid == user_id)
-        .order_by(DeckORM.id.desc())
-        .all()
-    )
-    return decks
+) -> ORJSONResponse:
+    # Один запрос вместо трёх (decks -> cards -> card_srs через selectinload):
+    # Postgres сам собирает карточки в JSON, ORM и Pydantic не участвуют.
+    rows = db.execute(_LIST_DECKS_SQL, {"uid": user["id"]}).mappings().all()
+    return ORJSONResponse(content=[dict(r) for r in rows])
+
+
+LIST_DECKS_STREAM_BATCH = int(os.getenv("LIST_DECKS_STREAM_BATCH", "100"))
+
 
+def _iter_decks_ndjson(uid: str) -> Iterator[bytes]:
+    # Своя сессия: генератор дочитывается уже после выхода из эндпоинта.
+    db = SessionLocal()
+    try:
+        result = db.execute(
+            _LIST_DECKS_SQL,
+            {"uid": uid},
+            execution_options={"yield_per": LIST_DECKS_STREAM_BATCH},
+        )
+        for row in result.mappings():
+            yield orjson.dumps(dict(row)) + b"\n"
+    finally:
+        db.close()
 
-@router.post("/", response_model=Deck, status_code=201)
+
+@router.get("/stream", responses={200: {"content": {"application/x-ndjson": {}}}})
+async def stream_decks(
+    user: Dict[str, Any] = Depends(get_current_user),
+) -> StreamingResponse:
+    """
+    То же, что GET /decks, но NDJSON: одна колода на строку, серверный курсор
+    по LIST_DECKS_STREAM_BATCH строк — память не растёт с числом колод.
+    """
+    return StreamingResponse(_iter_decks_ndjson(user["id"]), media_type="application/x-ndjson")
+
+
+@router.post("/", status_code=201, responses={201: {"model": Deck}})
 async def create_deck(
     payload: DeckCreate,
     db: Session = Depends(get_db),
     user: Dict[str, Any] = Depends(get_current_user),
-) -> Deck:
+) -> ORJSONResponse:
     user_id = user["id"]
     email = user.get("email") or ""
     full_name = user.get("user_metadata", {}).get("full_name") if isinstance(user.get("user_metadata"), dict) else None
@@ -112,28 +267,30 @@ async def create_deck(
     if not email:
         raise HTTPException(status_code=400, detail="Supabase user has no email")
 
-    public_user = _ensure_public_user(db, email=email, full_name=full_name)
+    public_id = _public_user_id(db, user_id, email=email, full_name=full_name)
 
     deck = DeckORM(
         title=payload.title,
         description=payload.description,
-        owner_id=public_user.id,   # ✅ مهم لتوافق DB constraint
+        owner_id=public_id,        # ✅ مهم لتوافق DB constraint
         owner_uid=user_id,         # ✅ UUID من Supabase
+        cards=[],                  # новая колода пуста — без lazy-load после commit
     )
 
     db.add(deck)
     db.commit()
-    db.refresh(deck)
-    return deck
+    _remember_public_user_id(user_id, public_id)
+    invalidate_stats(user["id"])
+    return ORJSONResponse(status_code=201, content=_deck_json(deck))
 
 
-@router.get("/{deck_id}", response_model=Deck)
+@router.get("/{deck_id}", responses={200: {"model": Deck}})
 async def get_deck(
     deck_id: int,
     db: Session = Depends(get_db),
     user: Dict[str, Any] = Depends(get_current_user),
-) -> Deck:
-    return _get_deck_or_404(db, deck_id, user["id"])
+) -> ORJSONResponse:
+    return ORJSONResponse(content=_deck_json(_get_deck_or_404(db, deck_id, user["id"], with_cards=True)))
 
 
 @router.delete("/{deck_id}", status_code=204)
@@ -142,27 +299,35 @@ async def delete_deck(
     db: Session = Depends(get_db),
     user: Dict[str, Any] = Depends(get_current_user),
 ) -> None:
-    deck = _get_deck_or_404(db, deck_id, user["id"])
-    db.delete(deck)
+    # один DELETE с проверкой владельца: карточки, SRS, сессии и ответы
+    # удаляет Postgres (ON DELETE CASCADE), ORM их не загружает
+    result = db.execute(
+        delete(DeckORM)
+        .where(DeckORM.id == deck_id, DeckORM.owner_uid == user["id"])
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount == 0:
+        raise HTTPException(status_code=404, detail="Deck not found")
     db.commit()
+    invalidate_stats(user["id"])
     return None
 
 
-@router.get("/{deck_id}/cards", response_model=List[Card])
+@router.get("/{deck_id}/cards", responses={200: {"model": List[Card]}})
 async def list_cards(
     deck_id: int,
     db: Session = Depends(get_db),
     user: Dict[str, Any] = Depends(get_current_user),
-) -> List[Card]:
+) -> ORJSONResponse:
     deck = _get_deck_or_404(db, deck_id, user["id"])
     cards = (
         db.query(CardORM)
-        .options(selectinload(CardORM.srs))
+        .options(undefer_group("content"), selectinload(CardORM.srs))
         .filter(CardORM.deck_id == deck.id)
         .order_by(CardORM.id.asc())
         .all()
     )
-    return cards
+    return ORJSONResponse(content=[_card_json(c) for c in cards])
 
 
 @router.post("/{deck_id}/cards", response_model=Card, status_code=201)
@@ -176,10 +341,39 @@ async def create_card(
     card = CardORM(deck_id=deck.id, question=payload.question, answer=payload.answer)
     db.add(card)
     db.commit()
-    db.refresh(card)
+    invalidate_stats(user["id"])
     return card
 
 
+def _bulk_insert_cards(db: Session, deck_id: int, cards: List[CardCreate]) -> List[Dict[str, Any]]:
+    # Один INSERT ... VALUES (...), (...) RETURNING вместо N отдельных INSERT:
+    # SQLAlchemy 2.0 (insertmanyvalues) склеивает executemany с RETURNING
+    # в один запрос на страницу до 1000 строк.
+    rows = db.execute(
+        insert(CardORM).returning(CardORM.id, CardORM.question, CardORM.answer),
+        [{"deck_id": deck_id, "question": c.question, "answer": c.answer} for c in cards],
+    ).mappings().all()
+    return [{"id": r["id"], "question": r["question"], "answer": r["answer"], "srs": None} for r in rows]
+
+
+@router.post("/{deck_id}/cards/bulk", status_code=201, responses={201: {"model": List[Card]}})
+async def create_cards_bulk(
+    deck_id: int,
+    payload: CardBulkCreate,
+    db: Session = Depends(get_db),
+    user: Dict[str, Any] = Depends(get_current_user),
+) -> ORJSONResponse:
+    """
+    Сохранить сразу все сгенерированные карточки: одна транзакция и один
+    INSERT вместо POST /{deck_id}/cards на каждую.
+    """
+    deck = _get_deck_or_404(db, deck_id, user["id"])
+    created = _bulk_insert_cards(db, deck.id, payload.cards)
+    db.commit()
+    invalidate_stats(user["id"])
+    return ORJSONResponse(status_code=201, content=created)
+
+
 @router.put("/{deck_id}/cards/{card_id}", response_model=Card)
 async def update_card(
     deck_id: int,
@@ -192,7 +386,6 @@ async def update_card(
     card.question = payload.question
     card.answer = payload.answer
     db.commit()
-    db.refresh(card)
     return card
 
 
@@ -206,4 +399,5 @@ async def delete_card(
     card = _get_card_or_404(db, deck_id, card_id, user["id"])
     db.delete(card)
     db.commit()
+    invalidate_stats(user["id"])
     return None
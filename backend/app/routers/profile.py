@@ -3,11 +3,14 @@ from __future__ import annotations
 from datetime import datetime
 from typing import Optional
 
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends
 from pydantic import BaseModel, Field
+from sqlalchemy import text
+from sqlalchemy.orm import Session
 
-# Используем общую "базу" из decks.py, чтобы уметь сбрасывать прогресс
-from .decks import DECKS_DB, CardSRS
+from backend.app.auth import get_current_user_id
+from backend.db import get_db
+from .stats import invalidate_stats
 
 router = APIRouter()
 
@@ -67,27 +70,48 @@ def update_profile(payload: ProfileUpdate) -> Profile:
     return IN_MEMORY_PROFILE
 
 
+# Сброс SRS всех карточек пользователя одним UPDATE (вместо цикла по картам);
+# в том же запросе считаем колоды — один round-trip.
+_RESET_PROGRESS_SQL = text(
+    """
+    WITH upd AS (
+        UPDATE card_srs s
+        SET "interval" = 0,
+            repetitions = 0,
+            ease_factor_q = 250,
+            next_review = NULL,
+            last_grade = NULL
+        FROM cards c
+        JOIN decks d ON d.id = c.deck_id
+        WHERE s.card_id = c.id AND d.owner_uid = :uid
+        RETURNING s.card_id
+    )
+    SELECT
+        (SELECT COUNT(*) FROM decks WHERE owner_uid = :uid) AS reset_decks,
+        (SELECT COUNT(*) FROM upd) AS reset_cards
+    """
+)
+
+
 @router.post("/reset-progress", response_model=ResetProgressResponse)
-def reset_progress() -> ResetProgressResponse:
+def reset_progress(
+    db: Session = Depends(get_db),
+    user_id: str = Depends(get_current_user_id),
+) -> ResetProgressResponse:
     """
-    Сбросить прогресс по всем карточкам во всех колодах:
-    - заново инициализируем SRS-параметры (CardSRS);
+    Сбросить прогресс по всем карточкам во всех колодах пользователя:
+    - заново инициализируем SRS-параметры (card_srs) одним bulk UPDATE;
     - обновляем last_reset_at в профиле.
     """
-    reset_decks = 0
-    reset_cards = 0
-
-    for deck in DECKS_DB.values():
-        reset_decks += 1
-        for card in deck.cards:
-            card.srs = CardSRS()
-            reset_cards += 1
+    row = db.execute(_RESET_PROGRESS_SQL, {"uid": user_id}).mappings().one()
+    db.commit()
+    invalidate_stats(user_id)
 
     ts = datetime.utcnow()
     IN_MEMORY_PROFILE.last_reset_at = ts
 
     return ResetProgressResponse(
-        reset_decks=reset_decks,
-        reset_cards=reset_cards,
+        reset_decks=int(row["reset_decks"] or 0),
+        reset_cards=int(row["reset_cards"] or 0),
         timestamp=ts,
     )
@@ -1,16 +1,19 @@
 # backend/app/routers/review.py
 
-from datetime import datetime, date, timedelta
-from math import ceil
-from typing import Optional
+from datetime import date, timedelta
+from typing import Dict, List, Optional
 
 from fastapi import APIRouter, Depends, HTTPException, Query
-from pydantic import BaseModel, conint
-from sqlalchemy import or_
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel, ConfigDict, Field, conint
+from sqlalchemy import func, text
 from sqlalchemy.orm import Session
 
+from backend.app.auth import get_current_user_id
+from backend.app.routers.stats import invalidate_stats
 from backend.db import (
     get_db,
+    get_today,
     Deck,
     Card,
     CardSRS,
@@ -24,33 +27,27 @@ router = APIRouter()
 # --------- Pydantic схемы для ответа ---------
 
 class CardSRSModel(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
     interval: int
     repetitions: int
     ease_factor: float
     next_review: Optional[date]      # ✅ DB: date
     last_grade: Optional[int]
 
-    class Config:
-        from_attributes = True
-
 
 class ReviewCard(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
     id: int
     question: str
     answer: str
     srs: Optional[CardSRSModel]
 
-    class Config:
-        from_attributes = True
-
 
 class DeckShort(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
     id: int
     title: str
 
-    class Config:
-        from_attributes = True
-
 
 class NextCardResponse(BaseModel):
     card: Optional[ReviewCard]
@@ -68,8 +65,32 @@ class AnswerResponse(BaseModel):
     next_card: Optional[ReviewCard]
 
 
+class AnswerItem(BaseModel):
+    card_id: int
+    grade: conint(ge=0, le=5)
+
+
+class AnswerBatchRequest(BaseModel):
+    deck_id: int
+    answers: List[AnswerItem] = Field(..., min_length=1, max_length=500)
+
+
+class AnswerBatchResponse(BaseModel):
+    success: bool
+    processed: int
+    next_card: Optional[ReviewCard]
+
+
 # --------- SM-2 update ---------
-def sm2_update(srs: CardSRS, grade: int) -> CardSRS:
+# EF delta for each quality 0..5 (SM-2 formula), in hundredths — like card_srs.ease_factor_q.
+# Every delta is an exact multiple of 0.02, so integer math loses nothing.
+_EF_DELTA_Q = tuple(round((0.1 - (5 - q) * (0.08 + (5 - q) * 0.02)) * 100) for q in range(6))
+_EF_MIN_Q = 130
+# card_srs.interval is SMALLINT (~89 years)
+_MAX_INTERVAL_DAYS = 32767
+
+
+def sm2_update(srs: CardSRS, grade: int, today: date) -> CardSRS:
     """
     SM-2:
     - quality: 0..5
@@ -77,9 +98,9 @@ def sm2_update(srs: CardSRS, grade: int) -> CardSRS:
     - intervals: 1, 6, then prev * EF (round up)
     - EF update formula, min 1.3
     :contentReference[oaicite:4]{index=4}
-    """
-    today = datetime.utcnow().date()
 
+    today приходит из эндпоинта (Depends(get_today)) — один раз на запрос.
+    """
     if grade < 3:
         srs.repetitions = 0
         srs.interval = 1
@@ -90,12 +111,10 @@ def sm2_update(srs: CardSRS, grade: int) -> CardSRS:
         elif srs.repetitions == 2:
             srs.interval = 6
         else:
-            srs.interval = max(1, int(ceil(srs.interval * srs.ease_factor)))
+            # ceil(interval * EF) in integers: EF is stored in hundredths
+            srs.interval = min(_MAX_INTERVAL_DAYS, max(1, -(-srs.interval * srs.ease_factor_q // 100)))
 
-    srs.ease_factor = max(
-        1.3,
-        srs.ease_factor + (0.1 - (5 - grade) * (0.08 + (5 - grade) * 0.02)),
-    )
+    srs.ease_factor_q = max(_EF_MIN_Q, srs.ease_factor_q + _EF_DELTA_Q[grade])
 
     srs.next_review = today + timedelta(days=srs.interval)
     srs.last_grade = grade
@@ -116,75 +135,80 @@ def get_or_create_open_session(db: Session, deck_id: int) -> ReviewSession:
     if session:
         return session
 
-    session = ReviewSession(
-        deck_id=deck_id,
-        started_at=datetime.utcnow(),
-        finished_at=None,
-    )
+    session = ReviewSession(deck_id=deck_id, finished_at=None)  # started_at = now() в БД
     db.add(session)
     db.flush()  # to get session.id
     return session
 
 
-# --------- Endpoints ---------
-
-@router.get("/next", response_model=NextCardResponse)
-def get_next_card(deck_id: int = Query(...), db: Session = Depends(get_db)):
-    deck = db.query(Deck).filter(Deck.id == deck_id).first()
-    if not deck:
-        raise HTTPException(status_code=404, detail="Deck not found")
+# Одна выборка и для due, и для новых карточек:
+# сначала due (по next_review, id), затем новые/без SRS (по id).
+_PICK_NEXT_SQL = text(
+    """
+    SELECT c.id, c.question, c.answer,
+           s.id AS srs_id, s."interval", s.repetitions, s.ease_factor_q / 100.0 AS ease_factor,
+           s.next_review, s.last_grade
+    FROM cards c
+    LEFT JOIN card_srs s ON s.card_id = c.id
+    WHERE c.deck_id = :deck_id
+      AND (s.next_review IS NULL OR s.next_review <= :today)
+    ORDER BY (s.next_review IS NULL), s.next_review, c.id
+    LIMIT 1
+    """
+)
 
-    q = (
-        db.query(Card, CardSRS)
-        .outerjoin(CardSRS, CardSRS.card_id == Card.id)
-        .filter(Card.deck_id == deck_id)
-    )
 
-    today = datetime.utcnow().date()
+def _pick_next(db: Session, deck_id: int, today: date) -> Optional[ReviewCard]:
+    row = db.execute(_PICK_NEXT_SQL, {"deck_id": deck_id, "today": today}).mappings().first()
+    if row is None:
+        return None
 
-    # 1) Due cards (next_review <= today)
-    candidates = (
-        q.filter(
-            CardSRS.next_review != None,  # noqa: E711
-            CardSRS.next_review <= today,
+    srs = None
+    if row["srs_id"] is not None:
+        srs = CardSRSModel(
+            interval=row["interval"],
+            repetitions=row["repetitions"],
+            ease_factor=row["ease_factor"],
+            next_review=row["next_review"],
+            last_grade=row["last_grade"],
         )
-        .order_by(CardSRS.next_review.asc(), Card.id.asc())
-        .all()
-    )
+    return ReviewCard(id=row["id"], question=row["question"], answer=row["answer"], srs=srs)
 
-    # 2) New/unscheduled cards (no SRS row OR next_review is NULL)
-    if not candidates:
-        new_cards = (
-            q.filter(
-                or_(
-                    CardSRS.id == None,           # noqa: E711
-                    CardSRS.next_review == None,  # noqa: E711
-                )
-            )
-            .order_by(Card.id.asc())
-            .all()
-        )
-        if not new_cards:
-            return NextCardResponse(card=None, deck=DeckShort.from_orm(deck))
-        card_obj, srs_obj = new_cards[0]
-    else:
-        card_obj, srs_obj = candidates[0]
 
-    card_out = ReviewCard(
-        id=card_obj.id,
-        question=card_obj.question,
-        answer=card_obj.answer,
-        srs=CardSRSModel.from_orm(srs_obj) if srs_obj else None,
-    )
+# --------- Endpoints ---------
+
+@router.get("/next", responses={200: {"model": NextCardResponse}})
+def get_next_card(
+    deck_id: int = Query(...),
+    db: Session = Depends(get_db),
+    user_id: str = Depends(get_current_user_id),
+    today: date = Depends(get_today),
+) -> ORJSONResponse:
+    deck = db.query(Deck).filter(Deck.id == deck_id, Deck.owner_uid == user_id).first()
+    if not deck:
+        raise HTTPException(status_code=404, detail="Deck not found")
 
-    return NextCardResponse(card=card_out, deck=DeckShort.from_orm(deck))
+    response = NextCardResponse(card=_pick_next(db, deck_id, today), deck=DeckShort.model_validate(deck))
+    # без response_model: сериализуем один раз, без jsonable_encoder
+    return ORJSONResponse(content=response.model_dump(mode="json"))
 
 
 @router.post("/answer", response_model=AnswerResponse)
-def answer_card(payload: AnswerRequest, db: Session = Depends(get_db)):
+def answer_card(
+    payload: AnswerRequest,
+    db: Session = Depends(get_db),
+    user_id: str = Depends(get_current_user_id),
+    today: date = Depends(get_today),
+):
+    # карточка из колоды текущего пользователя — чужие колоды дают 404
     card = (
         db.query(Card)
-        .filter(Card.id == payload.card_id, Card.deck_id == payload.deck_id)
+        .join(Deck, Deck.id == Card.deck_id)
+        .filter(
+            Card.id == payload.card_id,
+            Card.deck_id == payload.deck_id,
+            Deck.owner_uid == user_id,
+        )
         .first()
     )
     if not card:
@@ -208,26 +232,96 @@ def answer_card(payload: AnswerRequest, db: Session = Depends(get_db)):
         db.flush()
 
     # Update SRS (SM-2)
-    sm2_update(srs, int(payload.grade))
+    sm2_update(srs, int(payload.grade), today)
 
     # ✅ Save answer history (this will fill review_answers table)
     ans = ReviewAnswer(
         session_id=session.id,
         card_id=card.id,
-        rating=str(int(payload.grade)),  # store 0..5 as text
+        rating=payload.grade,
         note=None,
     )
     db.add(ans)
 
     db.commit()
-    db.refresh(srs)
+    invalidate_stats(user_id)
 
-    # Next card
-    next_response = get_next_card(deck_id=payload.deck_id, db=db)
+    # Next card (колода уже проверена выше через card.deck_id)
+    next_card = _pick_next(db, payload.deck_id, today)
 
     # ✅ If session finished, mark finished_at
-    if next_response.card is None:
-        session.finished_at = datetime.utcnow()
+    if next_card is None:
+        session.finished_at = func.now()
+        db.commit()
+
+    return AnswerResponse(success=True, next_card=next_card)
+
+
+@router.post("/answers/bulk", response_model=AnswerBatchResponse)
+def answer_cards_bulk(
+    payload: AnswerBatchRequest,
+    db: Session = Depends(get_db),
+    user_id: str = Depends(get_current_user_id),
+    today: date = Depends(get_today),
+):
+    """
+    Несколько ответов за один запрос: одна транзакция и один commit
+    вместо N POST /answer. Ответы применяются в порядке списка.
+    """
+    # колода текущего пользователя — иначе 404, как и для чужой карточки в /answer
+    if db.query(Deck.id).filter(Deck.id == payload.deck_id, Deck.owner_uid == user_id).first() is None:
+        raise HTTPException(status_code=404, detail="Deck not found")
+
+    card_ids = {a.card_id for a in payload.answers}
+
+    # все карточки должны принадлежать колоде — одним запросом
+    found = {
+        cid
+        for (cid,) in db.query(Card.id)
+        .filter(Card.deck_id == payload.deck_id, Card.id.in_(card_ids))
+        .all()
+    }
+    missing = card_ids - found
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Cards not found: {sorted(missing)}")
+
+    session = get_or_create_open_session(db, payload.deck_id)
+
+    srs_by_card: Dict[int, CardSRS] = {
+        srs.card_id: srs
+        for srs in db.query(CardSRS).filter(CardSRS.card_id.in_(card_ids)).all()
+    }
+    for cid in card_ids - srs_by_card.keys():
+        srs = CardSRS(
+            card_id=cid,
+            interval=0,
+            repetitions=0,
+            ease_factor=2.5,
+            next_review=None,
+            last_grade=None,
+        )
+        db.add(srs)
+        srs_by_card[cid] = srs
+
+    answers: List[ReviewAnswer] = []
+    for item in payload.answers:
+        sm2_update(srs_by_card[item.card_id], int(item.grade), today)
+        answers.append(
+            ReviewAnswer(
+                session_id=session.id,
+                card_id=item.card_id,
+                rating=item.grade,
+                note=None,
+            )
+        )
+    db.add_all(answers)
+
+    db.commit()
+    invalidate_stats(user_id)
+
+    next_card = _pick_next(db, payload.deck_id, today)
+    if next_card is None:
+        session.finished_at = func.now()
         db.commit()
 
-    return AnswerResponse(success=True, next_card=next_response.card)
+    return AnswerBatchResponse(success=True, processed=len(answers), next_card=next_card)
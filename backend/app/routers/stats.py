@@ -1,13 +1,18 @@
 from __future__ import annotations
 
+import os
+import threading
+import time
+from collections import OrderedDict
 from datetime import date
+from typing import Optional, Tuple
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Response
 from pydantic import BaseModel
-from sqlalchemy import or_, text
+from sqlalchemy import text
 from sqlalchemy.orm import Session
 
-from backend.db import get_db, Deck, Card, CardSRS
+from backend.db import get_db, get_today
 from backend.app.auth import get_current_user_id  # <-- عدّل المسار إذا ملفك بمكان مختلف
 
 router = APIRouter()
@@ -24,71 +29,105 @@ class StatsOverview(BaseModel):
     reviewed_cards: int
 
 
-@router.get("/overview", response_model=StatsOverview)
-def get_stats_overview(
-    db: Session = Depends(get_db),
-    user_id: str = Depends(get_current_user_id),  # <-- حماية + نجيب uid الحالي
-) -> StatsOverview:
-    today = date.today()
+# ---------- per-user cache (TTL + LRU) ----------
+# user_id -> (expires_at по time.monotonic(), готовый JSON); порядок = LRU.
+#
+# Кэш — в памяти процесса. invalidate_stats (из decks/review/profile) сбрасывает
+# запись только в том воркере, который обработал изменение; остальные воркеры
+# uvicorn (--workers N) отдают прежние цифры до истечения TTL. Поэтому TTL —
+# единственная гарантия согласованности между воркерами: держим его коротким
+# (STATS_CACHE_TTL_SEC=0 отключает кэш).
+STATS_CACHE_TTL_SEC = int(os.getenv("STATS_CACHE_TTL_SEC", "5"))
+STATS_CACHE_MAXSIZE = int(os.getenv("STATS_CACHE_MAXSIZE", "10000"))
 
-    # 1) Totals (ONLY user decks)
-    total_decks = db.query(Deck).filter(Deck.owner_uid == user_id).count()
+STATS_CACHE: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+# get_stats_overview — sync-эндпоинт (threadpool): get+move_to_end и вставка
+# с вытеснением идут из разных потоков
+_STATS_LOCK = threading.Lock()
 
-    total_cards = (
-        db.query(Card)
-        .join(Deck, Deck.id == Card.deck_id)
-        .filter(Deck.owner_uid == user_id)
-        .count()
-    )
 
-    # 2) Due today (ONLY cards in user decks)
-    due_today = (
-        db.query(Card)
-        .join(Deck, Deck.id == Card.deck_id)
-        .outerjoin(CardSRS, CardSRS.card_id == Card.id)
-        .filter(Deck.owner_uid == user_id)
-        .filter(
-            or_(
-                CardSRS.id.is_(None),
-                CardSRS.next_review.is_(None),
-                CardSRS.next_review <= today,
-            )
-        )
-        .count()
-    )
+def _stats_cache_get(user_id: str, now: float) -> Optional[bytes]:
+    with _STATS_LOCK:
+        entry = STATS_CACHE.get(user_id)
+        if entry is None:
+            return None
+        if entry[0] <= now:
+            del STATS_CACHE[user_id]
+            return None
+        STATS_CACHE.move_to_end(user_id)
+        return entry[1]
 
-    # 3) Learned (ONLY user cards)
-    learned_cards = (
-        db.query(CardSRS)
-        .join(Card, Card.id == CardSRS.card_id)
-        .join(Deck, Deck.id == Card.deck_id)
-        .filter(Deck.owner_uid == user_id)
-        .filter(CardSRS.repetitions >= 3)
-        .count()
-    )
 
-    # 4) Reviewed cards (ONLY user cards)
-    # نعتمد SQL لأن review_answers غالبًا جدول بدون ORM model عندك
-    reviewed_cards = int(
-        db.execute(
-            text(
-                """
-                SELECT COUNT(DISTINCT ra.card_id)
-                FROM review_answers ra
-                JOIN cards c ON c.id = ra.card_id
-                JOIN decks d ON d.id = c.deck_id
-                WHERE d.owner_uid = :uid
-                """
-            ),
-            {"uid": user_id},
-        ).scalar()
-        or 0
-    )
+def _stats_cache_set(user_id: str, body: bytes, expires_at: float) -> None:
+    with _STATS_LOCK:
+        STATS_CACHE[user_id] = (expires_at, body)
+        STATS_CACHE.move_to_end(user_id)
+        while len(STATS_CACHE) > STATS_CACHE_MAXSIZE:
+            STATS_CACHE.popitem(last=False)
+
+
+def invalidate_stats(user_id: str) -> None:
+    """Сбросить кэш статистики пользователя — только в текущем процессе."""
+    with _STATS_LOCK:
+        STATS_CACHE.pop(user_id, None)
+
 
-    return StatsOverview(
-        total_decks=total_decks,
-        total_cards=total_cards,
-        due_today=due_today,
-        learned_cards=learned_cards,
-        reviewed_cards=reviewed_cards,
+# due_today: нет SRS-строки / next_review пуст / срок наступил
+# learned_cards: repetitions >= 3
+_OVERVIEW_SQL = text(
+    """
+    WITH d AS (
+        SELECT id FROM decks WHERE owner_uid = :uid
+    ),
+    c AS (
+        SELECT c.id FROM cards c JOIN d ON d.id = c.deck_id
     )
+    SELECT
+        (SELECT COUNT(*) FROM d) AS total_decks,
+        (SELECT COUNT(*) FROM c) AS total_cards,
+        (
+            SELECT COUNT(*)
+            FROM c
+            LEFT JOIN card_srs s ON s.card_id = c.id
+            WHERE s.id IS NULL OR s.next_review IS NULL OR s.next_review <= :today
+        ) AS due_today,
+        (
+            SELECT COUNT(*)
+            FROM card_srs s
+            JOIN c ON c.id = s.card_id
+            WHERE s.repetitions >= 3
+        ) AS learned_cards,
+        (
+            SELECT COUNT(DISTINCT ra.card_id)
+            FROM review_answers ra
+            JOIN c ON c.id = ra.card_id
+        ) AS reviewed_cards
+    """
+)
+
+
+@router.get("/overview", responses={200: {"model": StatsOverview}})
+def get_stats_overview(
+    db: Session = Depends(get_db),
+    user_id: str = Depends(get_current_user_id),  # <-- حماية + نجيب uid الحالي
+    today: date = Depends(get_today),
+) -> Response:
+    now = time.monotonic()
+    cached = _stats_cache_get(user_id, now)
+    if cached is not None:
+        return Response(content=cached, media_type="application/json")
+
+    # Все пять счётчиков — одним запросом (раньше было 5 round-trip'ов).
+    row = db.execute(_OVERVIEW_SQL, {"uid": user_id, "today": today}).mappings().one()
+
+    body = StatsOverview(
+        total_decks=int(row["total_decks"] or 0),
+        total_cards=int(row["total_cards"] or 0),
+        due_today=int(row["due_today"] or 0),
+        learned_cards=int(row["learned_cards"] or 0),
+        reviewed_cards=int(row["reviewed_cards"] or 0),
+    ).model_dump_json().encode("utf-8")
+
+    if STATS_CACHE_TTL_SEC > 0:
+        _stats_cache_set(user_id, body, now + STATS_CACHE_TTL_SEC)
+    return Response(content=body, media_type="application/json")
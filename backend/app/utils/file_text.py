@@ -1,17 +1,184 @@
 from __future__ import annotations
 
+import hashlib
 import io
-import re
-from typing import Optional
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, Optional
 
 from docx import Document  # python-docx
 from pypdf import PdfReader  # pypdf
 
+try:
+    import fitz  # PyMuPDF — нативный разбор PDF, на порядок быстрее pypdf
+
+    _FITZ_AVAILABLE = True
+    # только текстовые операторы: без картинок и без сохранения лигатур
+    # (ﬁ -> fi, заодно удобнее для генерации карточек)
+    _FITZ_TEXT_FLAGS = fitz.TEXTFLAGS_TEXT & ~fitz.TEXT_PRESERVE_IMAGES & ~fitz.TEXT_PRESERVE_LIGATURES
+except Exception:  # ImportError — остаёмся на pypdf
+    _FITZ_AVAILABLE = False
+    _FITZ_TEXT_FLAGS = 0
+    fitz = None  # type: ignore[assignment]
+
+
+# ---------- тип файла: docx / pdf / text ----------
+# Одни таблицы и для extract_text_from_bytes, и для /ai/generate-file
+# (routers/ai.py добавляет к ним картинки). Если MIME и расширение указывают
+# на разные типы, побеждает более приоритетный: docx > pdf > text.
+
+TEXT_EXTS = frozenset({"txt", "md", "csv", "log"})
+
+DOCX_MIMES = frozenset({
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    "application/msword",
+})
+
+KIND_PRIORITY = {"docx": 0, "pdf": 1, "text": 2}
+
+KIND_BY_MIME = {
+    **{mime: "docx" for mime in DOCX_MIMES},
+    "application/pdf": "pdf",
+}
+
+KIND_BY_EXT = {
+    "docx": "docx",
+    "pdf": "pdf",
+    **{e: "text" for e in TEXT_EXTS},
+}
+
+
+def guess_ext(filename: str) -> str:
+    name = (filename or "").lower().strip()
+    if "." in name:
+        return name.rsplit(".", 1)[-1]
+    return ""
+
+
+def mime_kind(content_type: str) -> Optional[str]:
+    kind = KIND_BY_MIME.get(content_type)
+    if kind is None and content_type.startswith("text/"):
+        kind = "text"
+    return kind
+
+
+def detect_kind(filename: str, content_type: Optional[str] = None) -> Optional[str]:
+    kinds = [
+        k
+        for k in (mime_kind((content_type or "").lower()), KIND_BY_EXT.get(guess_ext(filename)))
+        if k is not None
+    ]
+    return min(kinds, key=KIND_PRIORITY.__getitem__) if kinds else None
+
+
+# ---------- разбор ----------
+
+_NUL_TO_SPACE = str.maketrans({"\x00": " "})
+
 
 def _clean_text(s: str) -> str:
-    s = s.replace("\x00", " ")
-    s = re.sub(r"\s+", " ", s).strip()
-    return s
+    # split() без аргументов режет по любым пробельным символам в C —
+    # быстрее re.sub(r"\s+", " ", ...) на многомегабайтном тексте
+    return " ".join(s.translate(_NUL_TO_SPACE).split())
+
+
+def _take_pages(pages: Iterable[str], max_chars: Optional[int]) -> str:
+    # max_chars: дальше текст всё равно обрежут — не разбираем лишние страницы
+    out = []
+    total = 0
+    for text in pages:
+        out.append(text)
+        total += len(text)
+        if max_chars is not None and total >= max_chars:
+            break
+    return "\n".join(out)
+
+
+def _pypdf_pages(file_bytes: bytes) -> Iterable[str]:
+    for page in PdfReader(io.BytesIO(file_bytes)).pages:
+        try:
+            yield page.extract_text() or ""
+        except Exception:
+            yield ""
+
+
+def _pdf_text(file_bytes: bytes, max_chars: Optional[int]) -> str:
+    # Последовательно: PyMuPDF разбирает ~1 мс на страницу, и с лимитом
+    # max_chars пул процессов не окупает даже свой запуск.
+    if _FITZ_AVAILABLE:
+        try:
+            with fitz.open(stream=file_bytes, filetype="pdf") as doc:
+                # пустые страницы не фильтруем: _clean_text всё равно схлопнет пробелы
+                return _take_pages((page.get_text("text", flags=_FITZ_TEXT_FLAGS) for page in doc), max_chars)
+        except Exception:
+            # зашифрованные/битые PDF — пробуем ещё раз через pypdf
+            pass
+    return _take_pages(_pypdf_pages(file_bytes), max_chars)
+
+
+def _handle_text(file_bytes: bytes, max_chars: Optional[int]) -> str:
+    try:
+        return _clean_text(file_bytes.decode("utf-8"))
+    except UnicodeDecodeError:
+        # в т.ч. символ, разрезанный лимитом чтения загрузки
+        return _clean_text(file_bytes.decode("utf-8", errors="ignore"))
+
+
+def _handle_docx(file_bytes: bytes, max_chars: Optional[int]) -> str:
+    doc = Document(io.BytesIO(file_bytes))
+    # генератор вместо списка; isspace() не создаёт strip-копию абзаца
+    return _clean_text("\n".join(p.text for p in doc.paragraphs if p.text and not p.text.isspace()))
+
+
+def _handle_pdf(file_bytes: bytes, max_chars: Optional[int]) -> str:
+    return _clean_text(_pdf_text(file_bytes, max_chars))
+
+
+_HANDLERS: Dict[str, Callable[[bytes, Optional[int]], str]] = {
+    "docx": _handle_docx,
+    "pdf": _handle_pdf,
+    "text": _handle_text,
+}
+
+
+# blake2b(bytes):kind:max_chars -> извлечённый текст. Один и тот же файл часто
+# загружают повторно (меняя только число карточек) — не разбираем его заново.
+TEXT_CACHE_MAXSIZE = int(os.getenv("FILE_TEXT_CACHE_MAXSIZE", "128"))
+
+_TEXT_CACHE: "OrderedDict[str, str]" = OrderedDict()
+# extract_text зовут из asyncio.to_thread — get+move_to_end и вставка из разных потоков
+_TEXT_CACHE_LOCK = threading.Lock()
+
+
+def extract_text(
+    file_bytes: bytes,
+    kind: str,
+    max_chars: Optional[int] = None,
+    digest: Optional[str] = None,
+) -> str:
+    """
+    Текст файла известного типа (kind из detect_kind: docx / pdf / text).
+
+    max_chars — PDF разбирается постранично, пока не наберётся столько символов;
+    digest — готовый хэш байтов (routers/ai.py считает его при чтении загрузки).
+    """
+    handler = _HANDLERS[kind]
+    if digest is None:
+        digest = hashlib.blake2b(file_bytes, digest_size=16).hexdigest()
+    key = f"{digest}:{kind}:{max_chars}"
+    with _TEXT_CACHE_LOCK:
+        text = _TEXT_CACHE.get(key)
+        if text is not None:
+            _TEXT_CACHE.move_to_end(key)
+            return text
+
+    text = handler(file_bytes, max_chars)
+    with _TEXT_CACHE_LOCK:
+        _TEXT_CACHE[key] = text
+        while len(_TEXT_CACHE) > TEXT_CACHE_MAXSIZE:
+            _TEXT_CACHE.popitem(last=False)
+    return text
 
 
 def extract_text_from_bytes(
@@ -22,34 +189,11 @@ def extract_text_from_bytes(
     """
     Extract text from TXT / DOCX / PDF.
     - DOCX: python-docx Document accepts a file-like object (BytesIO). :contentReference[oaicite:1]{index=1}
-    - PDF: pypdf PdfReader + page.extract_text(). :contentReference[oaicite:2]{index=2}
-    """
-    name = (filename or "").lower().strip()
+    - PDF: PyMuPDF page.get_text("text"); pypdf PdfReader как запасной вариант. :contentReference[oaicite:2]{index=2}
 
-    # TXT
-    if name.endswith(".txt") or (content_type or "").startswith("text/"):
-        try:
-            return _clean_text(file_bytes.decode("utf-8"))
-        except UnicodeDecodeError:
-            return _clean_text(file_bytes.decode("utf-8", errors="ignore"))
-
-    # DOCX
-    if name.endswith(".docx") or content_type in {
-        "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-    }:
-        doc = Document(io.BytesIO(file_bytes))
-        parts = [p.text for p in doc.paragraphs if p.text and p.text.strip()]
-        return _clean_text("\n".join(parts))
-
-    # PDF
-    if name.endswith(".pdf") or content_type == "application/pdf":
-        reader = PdfReader(io.BytesIO(file_bytes))
-        pages_text = []
-        for page in reader.pages:
-            t = page.extract_text() or ""
-            if t.strip():
-                pages_text.append(t)
-        return _clean_text("\n".join(pages_text))
-
-    # Unsupported
-    raise ValueError("Unsupported file type. Please upload TXT, DOCX, or PDF.")
+    Тип — detect_kind (MIME и расширение, docx > pdf > text).
+    """
+    kind = detect_kind(filename, content_type)
+    if kind is None:
+        raise ValueError("Unsupported file type. Please upload TXT, DOCX, or PDF.")
+    return extract_text(file_bytes, kind)
@@ -2,19 +2,21 @@
 from __future__ import annotations
 
 import os
-from datetime import date, datetime
+from datetime import date, datetime, timezone
 from typing import Generator, Optional
 
-from dotenv import load_dotenv
 from sqlalchemy import (
     create_engine,
     Date,
     DateTime,
-    Float,
     ForeignKey,
+    Index,
     Integer,
+    SmallInteger,
     String,
     Text,
+    func,
+    text,
 )
 from sqlalchemy.orm import (
     declarative_base,
@@ -26,16 +28,46 @@ from sqlalchemy.orm import (
 
 # Postgres UUID type (Supabase Postgres)
 from sqlalchemy.dialects.postgresql import UUID as PG_UUID
+from sqlalchemy.ext.hybrid import hybrid_property
 
-load_dotenv()
+# .env только для локальной разработки (APP_ENV != prod)
+if os.getenv("APP_ENV", "prod") != "prod":
+    from dotenv import load_dotenv
+
+    load_dotenv()
 
 SUPABASE_DB_URL = os.getenv("SUPABASE_DB_URL")
 if not SUPABASE_DB_URL:
-    raise RuntimeError("SUPABASE_DB_URL is not set. Check your .env file and environment.")
+    raise RuntimeError(
+        "SUPABASE_DB_URL is not set. Check your environment (or set APP_ENV=dev to load .env)."
+    )
 
-engine = create_engine(SUPABASE_DB_URL, pool_pre_ping=True)
+# Пул соединений под конкурентность воркера (дефолт SQLAlchemy — 5 + 10).
+# LIFO держит "тёплыми" недавно использованные соединения, recycle — против
+# обрывов idle-соединений со стороны Supabase/PgBouncer.
+# pre-ping — лишний round-trip на каждый checkout; при стабильной сети
+# и recycle его можно выключить (DB_POOL_PRE_PING=0).
+# query_cache_size: кэш скомпилированного SQL (дефолт 500) — с запасом
+# под все ORM-запросы и text()-выборки роутеров.
+engine = create_engine(
+    SUPABASE_DB_URL,
+    pool_size=int(os.getenv("DB_POOL_SIZE", "20")),
+    max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "40")),
+    pool_recycle=int(os.getenv("DB_POOL_RECYCLE_SEC", "1800")),
+    pool_pre_ping=os.getenv("DB_POOL_PRE_PING", "1") != "0",
+    pool_use_lifo=True,
+    pool_reset_on_return="rollback",
+    query_cache_size=int(os.getenv("DB_QUERY_CACHE_SIZE", "1200")),
+)
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# expire_on_commit=False: после commit() атрибуты не сбрасываются,
+# и чтение объекта не вызывает лишний SELECT.
+SessionLocal = sessionmaker(
+    autocommit=False,
+    autoflush=False,
+    expire_on_commit=False,
+    bind=engine,
+)
 
 Base = declarative_base()
 
@@ -48,12 +80,17 @@ class User(Base):
     """
     __tablename__ = "users"
 
-    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
     email: Mapped[str] = mapped_column(String, nullable=False)
     full_name: Mapped[Optional[str]] = mapped_column(String, nullable=True)
 
     decks: Mapped[list["Deck"]] = relationship("Deck", back_populates="owner")
 
+    __table_args__ = (
+        # _ensure_public_user ищет по email
+        Index("users_email_idx", "email"),
+    )
+
     def __repr__(self) -> str:
         return f"<User id={self.id} email={self.email!r}>"
 
@@ -64,7 +101,7 @@ class Deck(Base):
     """
     __tablename__ = "decks"
 
-    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
     title: Mapped[str] = mapped_column(String(200), nullable=False)
     description: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
 
@@ -77,16 +114,25 @@ class Deck(Base):
 
     owner: Mapped["User"] = relationship("User", back_populates="decks")
 
+    # passive_deletes: дочерние строки удаляет сам Postgres (ON DELETE CASCADE),
+    # ORM не загружает их перед удалением колоды/карточки
     cards: Mapped[list["Card"]] = relationship(
         "Card",
         back_populates="deck",
         cascade="all, delete-orphan",
+        passive_deletes=True,
     )
 
     review_sessions: Mapped[list["ReviewSession"]] = relationship(
         "ReviewSession",
         back_populates="deck",
         cascade="all, delete-orphan",
+        passive_deletes=True,
+    )
+
+    __table_args__ = (
+        # WHERE owner_uid = :uid ORDER BY id DESC — список колод, статистика, проверка владельца
+        Index("decks_owner_uid_id_idx", "owner_uid", "id"),
     )
 
     def __repr__(self) -> str:
@@ -96,17 +142,19 @@ class Deck(Base):
 class Card(Base):
     __tablename__ = "cards"
 
-    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
 
     deck_id: Mapped[int] = mapped_column(
         Integer,
-        ForeignKey("decks.id"),
+        ForeignKey("decks.id", ondelete="CASCADE"),
         index=True,
         nullable=False,
     )
 
-    question: Mapped[str] = mapped_column(Text, nullable=False)
-    answer: Mapped[str] = mapped_column(Text, nullable=False)
+    # Текст карточки грузится только по требованию (undefer_group("content")):
+    # проверки владельца, ответы и каскадное удаление его не читают.
+    question: Mapped[str] = mapped_column(Text, nullable=False, deferred=True, deferred_group="content")
+    answer: Mapped[str] = mapped_column(Text, nullable=False, deferred=True, deferred_group="content")
 
     deck: Mapped["Deck"] = relationship("Deck", back_populates="cards")
 
@@ -115,12 +163,19 @@ class Card(Base):
         back_populates="card",
         uselist=False,
         cascade="all, delete-orphan",
+        passive_deletes=True,
     )
 
     review_answers: Mapped[list["ReviewAnswer"]] = relationship(
         "ReviewAnswer",
         back_populates="card",
         cascade="all, delete-orphan",
+        passive_deletes=True,
+    )
+
+    __table_args__ = (
+        # WHERE deck_id = :d ORDER BY id — index-only порядок для /review/next и списков
+        Index("cards_deck_id_id_idx", "deck_id", "id"),
     )
 
     def __repr__(self) -> str:
@@ -130,24 +185,54 @@ class Card(Base):
 class CardSRS(Base):
     __tablename__ = "card_srs"
 
-    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
 
     card_id: Mapped[int] = mapped_column(
         Integer,
-        ForeignKey("cards.id"),
+        ForeignKey("cards.id", ondelete="CASCADE"),
         unique=True,
         index=True,
         nullable=False,
     )
 
-    interval: Mapped[int] = mapped_column(Integer, default=0)
-    repetitions: Mapped[int] = mapped_column(Integer, default=0)
-    ease_factor: Mapped[float] = mapped_column(Float, default=2.5)
+    # SMALLINT вместо int4/float8: строка уже, скан card_srs дешевле.
+    # EF хранится в сотых (130..): все шаги SM-2 кратны 0.02, так что без потерь.
+    interval: Mapped[int] = mapped_column(SmallInteger, default=0)
+    repetitions: Mapped[int] = mapped_column(SmallInteger, default=0)
+    ease_factor_q: Mapped[int] = mapped_column(SmallInteger, default=250)
     next_review: Mapped[Optional[date]] = mapped_column(Date, nullable=True)
     last_grade: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
 
     card: Mapped["Card"] = relationship("Card", back_populates="srs")
 
+    @hybrid_property
+    def ease_factor(self) -> float:
+        return self.ease_factor_q / 100
+
+    @ease_factor.inplace.setter
+    def _ease_factor_setter(self, value: float) -> None:
+        self.ease_factor_q = round(value * 100)
+
+    @ease_factor.inplace.expression
+    @classmethod
+    def _ease_factor_expression(cls):
+        return cls.ease_factor_q / 100.0
+
+    __table_args__ = (
+        # покрывающий индекс: LEFT JOIN card_srs по card_id без обращения к heap
+        Index(
+            "card_srs_card_id_cover_idx",
+            "card_id",
+            postgresql_include=["next_review", "interval", "repetitions", "ease_factor_q", "last_grade"],
+        ),
+        # новые карточки (next_review IS NULL) — частичный индекс
+        Index(
+            "card_srs_unscheduled_idx",
+            "card_id",
+            postgresql_where=text("next_review IS NULL"),
+        ),
+    )
+
     def __repr__(self) -> str:
         return f"<CardSRS card_id={self.card_id} interval={self.interval} reps={self.repetitions} ef={self.ease_factor}>"
 
@@ -155,17 +240,18 @@ class CardSRS(Base):
 class ReviewSession(Base):
     __tablename__ = "review_sessions"
 
-    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
 
     deck_id: Mapped[int] = mapped_column(
         Integer,
-        ForeignKey("decks.id"),
+        ForeignKey("decks.id", ondelete="CASCADE"),
         index=True,
         nullable=False,
     )
 
-    started_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
-    finished_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    # время ставит Postgres (now()), с часовым поясом — без datetime.utcnow() в приложении
+    started_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    finished_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
 
     deck: Mapped["Deck"] = relationship("Deck", back_populates="review_sessions")
 
@@ -173,6 +259,17 @@ class ReviewSession(Base):
         "ReviewAnswer",
         back_populates="session",
         cascade="all, delete-orphan",
+        passive_deletes=True,
+    )
+
+    __table_args__ = (
+        # открытая сессия колоды: deck_id = :d AND finished_at IS NULL ORDER BY started_at DESC
+        Index(
+            "review_sessions_open_idx",
+            "deck_id",
+            "started_at",
+            postgresql_where=text("finished_at IS NULL"),
+        ),
     )
 
     def __repr__(self) -> str:
@@ -182,23 +279,23 @@ class ReviewSession(Base):
 class ReviewAnswer(Base):
     __tablename__ = "review_answers"
 
-    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
 
     session_id: Mapped[int] = mapped_column(
         Integer,
-        ForeignKey("review_sessions.id"),
+        ForeignKey("review_sessions.id", ondelete="CASCADE"),
         index=True,
         nullable=False,
     )
 
     card_id: Mapped[int] = mapped_column(
         Integer,
-        ForeignKey("cards.id"),
+        ForeignKey("cards.id", ondelete="CASCADE"),
         index=True,
         nullable=False,
     )
 
-    rating: Mapped[str] = mapped_column(String(50), nullable=False)
+    rating: Mapped[int] = mapped_column(SmallInteger, nullable=False)  # оценка SM-2 0..5
     note: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
 
     session: Mapped["ReviewSession"] = relationship("ReviewSession", back_populates="answers")
@@ -208,8 +305,147 @@ class ReviewAnswer(Base):
         return f"<ReviewAnswer id={self.id} session_id={self.session_id} card_id={self.card_id}>"
 
 
+# init_db выполняется в lifespan каждого uvicorn-воркера (--workers N):
+# транзакционный advisory lock выстраивает их в очередь, и проверки
+# information_schema делает только тот, кто держит лок. Следующий воркер
+# видит уже мигрированную схему и ничего не меняет.
+_INIT_DB_LOCK_KEY = 0x466C617368  # "Flash"
+_INIT_DB_LOCK_SQL = text("SELECT pg_advisory_xact_lock(:key)")
+
+_RATING_TYPE_SQL = text(
+    """
+    SELECT data_type FROM information_schema.columns
+    WHERE table_schema = current_schema()
+      AND table_name = 'review_answers' AND column_name = 'rating'
+    """
+)
+
+_RATING_TO_SMALLINT_SQL = text(
+    "ALTER TABLE review_answers ALTER COLUMN rating TYPE SMALLINT USING rating::smallint"
+)
+
+_SRS_EASE_FACTOR_EXISTS_SQL = text(
+    """
+    SELECT 1 FROM information_schema.columns
+    WHERE table_schema = current_schema()
+      AND table_name = 'card_srs' AND column_name = 'ease_factor'
+    """
+)
+
+# float ease_factor -> сотые в SMALLINT; interval/repetitions -> SMALLINT
+_SRS_TO_SMALLINT_SQL = text(
+    """
+    ALTER TABLE card_srs
+        ALTER COLUMN ease_factor TYPE SMALLINT USING round(ease_factor * 100)::smallint,
+        ALTER COLUMN "interval" TYPE SMALLINT USING LEAST("interval", 32767)::smallint,
+        ALTER COLUMN repetitions TYPE SMALLINT USING LEAST(repetitions, 32767)::smallint;
+    ALTER TABLE card_srs RENAME COLUMN ease_factor TO ease_factor_q;
+    """
+)
+
+
+_SESSION_TS_TYPE_SQL = text(
+    """
+    SELECT data_type FROM information_schema.columns
+    WHERE table_schema = current_schema()
+      AND table_name = 'review_sessions' AND column_name = 'started_at'
+    """
+)
+
+# timestamp (UTC из приложения) -> timestamptz + DEFAULT now()
+_SESSION_TS_TO_TZ_SQL = text(
+    """
+    ALTER TABLE review_sessions
+        ALTER COLUMN started_at TYPE TIMESTAMPTZ USING started_at AT TIME ZONE 'UTC',
+        ALTER COLUMN finished_at TYPE TIMESTAMPTZ USING finished_at AT TIME ZONE 'UTC',
+        ALTER COLUMN started_at SET DEFAULT now()
+    """
+)
+
+# Раньше PK объявлялись с index=True — create_all строил ix_<table>_id
+# поверх индекса самого первичного ключа. Лишний b-tree только замедляет вставки.
+_REDUNDANT_PK_INDEXES = (
+    "ix_users_id",
+    "ix_decks_id",
+    "ix_cards_id",
+    "ix_card_srs_id",
+    "ix_review_sessions_id",
+    "ix_review_answers_id",
+)
+
+
+# Внешние ключи колода -> карточки -> SRS/ответы, колода -> сессии -> ответы
+# создавались без ON DELETE CASCADE; удаление колоды теперь — один DELETE,
+# остальное удаляет Postgres. Старые FK пересоздаём с каскадом.
+_CASCADE_FKS = (
+    ("cards", "deck_id"),
+    ("card_srs", "card_id"),
+    ("review_sessions", "deck_id"),
+    ("review_answers", "session_id"),
+    ("review_answers", "card_id"),
+)
+
+_NON_CASCADE_FKS_SQL = text(
+    """
+    SELECT c.conname, t.relname AS tbl, a.attname AS col, r.relname AS ref
+    FROM pg_constraint c
+    JOIN pg_class t ON t.oid = c.conrelid
+    JOIN pg_class r ON r.oid = c.confrelid
+    JOIN pg_attribute a ON a.attrelid = c.conrelid AND a.attnum = c.conkey[1]
+    WHERE c.contype = 'f'
+      AND c.confdeltype <> 'c'
+      AND t.relnamespace = current_schema()::regnamespace
+      AND t.relname = :tbl AND a.attname = :col
+    """
+)
+
+
 def init_db() -> None:
-    Base.metadata.create_all(bind=engine)
+    # Всё — одной транзакцией под advisory lock: create_all, миграции, индексы.
+    with engine.begin() as conn:
+        conn.execute(_INIT_DB_LOCK_SQL, {"key": _INIT_DB_LOCK_KEY})
+
+        Base.metadata.create_all(bind=conn)
+
+        # Миграции старых схем — до индексов: индексы ссылаются на новые колонки.
+        # review_answers.rating раньше хранился как текст "0".."5" — переводим на месте.
+        data_type = conn.execute(_RATING_TYPE_SQL).scalar()
+        if data_type is not None and data_type != "smallint":
+            conn.execute(_RATING_TO_SMALLINT_SQL)
+
+        # card_srs.ease_factor (float) -> ease_factor_q (сотые, SMALLINT)
+        if conn.execute(_SRS_EASE_FACTOR_EXISTS_SQL).scalar():
+            conn.execute(_SRS_TO_SMALLINT_SQL)
+
+        if conn.execute(_SESSION_TS_TYPE_SQL).scalar() == "timestamp without time zone":
+            conn.execute(_SESSION_TS_TO_TZ_SQL)
+
+        for tbl, col in _CASCADE_FKS:
+            for fk in conn.execute(_NON_CASCADE_FKS_SQL, {"tbl": tbl, "col": col}).mappings():
+                conn.execute(
+                    text(
+                        f'ALTER TABLE "{fk["tbl"]}" DROP CONSTRAINT "{fk["conname"]}", '
+                        f'ADD CONSTRAINT "{fk["conname"]}" FOREIGN KEY ("{fk["col"]}") '
+                        f'REFERENCES "{fk["ref"]}" (id) ON DELETE CASCADE'
+                    )
+                )
+
+        for name in _REDUNDANT_PK_INDEXES:
+            conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+
+        # create_all не добавляет индексы в уже существующие таблицы (миграций нет),
+        # поэтому индексы из __table_args__ досоздаём явно.
+        for table in (User.__table__, Deck.__table__, Card.__table__, CardSRS.__table__, ReviewSession.__table__):
+            for index in table.indexes:
+                index.create(bind=conn, checkfirst=True)
+
+
+def get_today() -> date:
+    """
+    Текущая дата по UTC (не по локальному времени сервера) — один раз на запрос.
+    В ней же считается next_review, поэтому due_today в /stats совпадает с /review/next.
+    """
+    return datetime.now(timezone.utc).date()
 
 
 def get_db() -> Generator:
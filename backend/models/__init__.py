@@ -3,25 +3,34 @@
 """
 Пакет ORM-моделей для БД Auto-Flashcards.
 
+Единственное определение моделей — backend/db.py (один Base и одна MetaData,
+по которой init_db делает create_all). Здесь только реэкспорт, чтобы
+`from backend.models import Card` давал те же классы, что и роутеры.
+
 Содержит:
-- Base — базовый класс (models.base)
+- Base — декларативная база
 - User — пользователь
 - Deck — колода
-- Card — карточка
+- Card, CardSRS — карточка и её SRS-состояние
 - ReviewSession, ReviewAnswer — сессии повторения и ответы
 """
 
-from .base import Base
-from .user import User
-from .deck import Deck
-from .card import Card
-from .review import ReviewSession, ReviewAnswer
+from backend.db import (
+    Base,
+    User,
+    Deck,
+    Card,
+    CardSRS,
+    ReviewSession,
+    ReviewAnswer,
+)
 
 __all__ = [
     "Base",
     "User",
     "Deck",
     "Card",
+    "CardSRS",
     "ReviewSession",
     "ReviewAnswer",
 ]
@@ -403,9 +403,8 @@ export default function HomePage() {
 
     setLoadingAI(true);
     try {
-      const response = await fetch(`${API_BASE_URL}/ai/generate`, {
+      const response = await fetchWithAuth(`${API_BASE_URL}/ai/generate`, {
         method: "POST",
-        headers: { "Content-Type": "application/json" },
         body: JSON.stringify({ text: trimmed, max_cards: maxCardsNumber }),
       });
 
@@ -336,7 +336,7 @@ export default function ProfilePage() {
       const maxCards = clampInt(uploadMaxCards, MIN_GENERATE_CARDS, MAX_GENERATE_CARDS);
       form.append("max_cards", String(maxCards));
 
-      const aiRes = await fetch(`${API_BASE}/ai/generate-file`, {
+      const aiRes = await apiFetch("/ai/generate-file", {
         method: "POST",
         body: form,
       });
@@ -350,20 +350,24 @@ export default function ProfilePage() {
       const cards = aiJson.cards || [];
       if (!cards.length) throw new Error(t("messages.aiNoCards"));
 
+      const payload = [];
       for (const card of cards) {
         const question = clipStr(card.question, MAX_QUESTION_LEN).trim();
         const answer = clipStr(card.answer, MAX_ANSWER_LEN).trim();
 
         if (!question || !answer) continue;
+        payload.push({ question, answer });
+      }
 
-        const res = await apiFetch(`/decks/${deckId}/cards`, {
+      if (payload.length) {
+        const res = await apiFetch(`/decks/${deckId}/cards/bulk`, {
           method: "POST",
-          body: JSON.stringify({ question, answer }),
+          body: JSON.stringify({ cards: payload }),
         });
 
         if (!res.ok) {
           const txt = await res.text();
-          console.error("Error creating card:", txt);
+          console.error("Error creating cards:", txt);
         }
       }
 
@@ -0,0 +1,139 @@
+# ml/service/batching.py
+
+"""
+Коалесцирование параллельных запросов на генерацию карточек.
+
+Запросы, пришедшие в течение короткого окна (max_wait_ms), собираются
+в один пакет (до max_batch штук) и отдаются в FlashcardsService.generate_batch.
+Один consumer-корутин запускается из lifespan (backend/app/main.py).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+from typing import List, Optional, Set, Tuple
+
+from ml.service.flashcards_service import (
+    FlashcardsRequest,
+    FlashcardsResponse,
+    FlashcardsService,
+)
+
+logger = logging.getLogger(__name__)
+
+MAX_BATCH = int(os.getenv("FLASHCARDS_MAX_BATCH", "8"))
+MAX_WAIT_MS = float(os.getenv("FLASHCARDS_MAX_WAIT_MS", "30"))
+
+_Item = Tuple[FlashcardsRequest, "asyncio.Future[FlashcardsResponse]"]
+
+
+class BatchingFlashcardsQueue:
+    """
+    asyncio.Queue + один consumer.
+
+    submit() кладёт запрос в очередь и ждёт свой Future;
+    consumer забирает до max_batch запросов (ждёт не дольше max_wait_ms
+    после первого) и выполняет пакет в отдельном потоке, не дожидаясь
+    его завершения перед сбором следующего.
+    """
+
+    def __init__(
+        self,
+        service: FlashcardsService,
+        max_batch: int = MAX_BATCH,
+        max_wait_ms: float = MAX_WAIT_MS,
+    ):
+        self._service = service
+        self._max_batch = max(1, max_batch)
+        self._max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._queue: Optional["asyncio.Queue[_Item]"] = None
+        self._consumer: Optional[asyncio.Task] = None
+        self._inflight: Set[asyncio.Task] = set()
+        # забранные _collect из очереди, но ещё не переданные в _dispatch
+        self._collecting: List[_Item] = []
+
+    def start(self) -> None:
+        # очередь создаём внутри работающего event loop
+        if self._consumer is None:
+            self._queue = asyncio.Queue()
+            self._consumer = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._consumer is None:
+            return
+        self._consumer.cancel()
+        try:
+            await self._consumer
+        except asyncio.CancelledError:
+            pass
+        self._consumer = None
+
+        # не оставляем висящих ожидающих: недособранный пакет и очередь — ошибка,
+        # уже отправленные пакеты дожидаемся (их результат ждут вызывающие)
+        stopped = RuntimeError("Flashcards queue is stopped")
+        for _, fut in self._collecting:
+            if not fut.done():
+                fut.set_exception(stopped)
+        self._collecting = []
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+        while not self._queue.empty():
+            _, fut = self._queue.get_nowait()
+            if not fut.done():
+                fut.set_exception(stopped)
+        self._queue = None
+
+    async def submit(self, request: FlashcardsRequest) -> FlashcardsResponse:
+        # без запущенного consumer (например, TestClient без lifespan) — напрямую
+        if self._consumer is None or self._queue is None:
+            return await asyncio.to_thread(self._service.generate, request)
+
+        fut: "asyncio.Future[FlashcardsResponse]" = asyncio.get_running_loop().create_future()
+        await self._queue.put((request, fut))
+        return await fut
+
+    async def _collect(self) -> List[_Item]:
+        # тот же список, что self._collecting: при отмене consumer его разберёт stop()
+        batch = self._collecting = [await self._queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self._max_wait
+        while len(batch) < self._max_batch:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        self._collecting = []
+        return batch
+
+    async def _dispatch(self, batch: List[_Item]) -> None:
+        requests = [req for req, _ in batch]
+        try:
+            results = await asyncio.to_thread(self._service.generate_batch, requests)
+        except Exception as exc:
+            logger.error("Пакетная генерация карточек упала: %r", exc)
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(exc)
+            return
+
+        # исключение — только у запросов, чей LLM-запрос упал
+        for (_, fut), result in zip(batch, results):
+            if fut.done():
+                continue
+            if isinstance(result, BaseException):
+                fut.set_exception(result)
+            else:
+                fut.set_result(result)
+
+    async def _run(self) -> None:
+        # пакет выполняется отдельной задачей, чтобы сбор следующего не ждал LLM
+        while True:
+            batch = await self._collect()
+            task = asyncio.create_task(self._dispatch(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
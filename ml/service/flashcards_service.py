@@ -2,39 +2,79 @@
 
 from __future__ import annotations
 
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
 from dataclasses import dataclass
-from typing import List, Dict, Tuple, Optional
+from typing import Callable, List, Dict, Mapping, Sequence, Tuple, Optional, Union
+import hashlib
+import re
+import sys
+import threading
 import time
 import logging
 
-from ml.models.baseline import generate_flashcards
+try:
+    import xxhash
+except ImportError:  # xxhash не установлен — blake2b из stdlib
+    xxhash = None  # type: ignore[assignment]
+
+from ml.models.baseline import LLM_PROMPT_BATCHING, generate_flashcards, generate_flashcards_many
 from ml.tracing.langfuse_config import trace_generation
 
 logger = logging.getLogger(__name__)
 
+# число страйпов для локов single-flight (степень двойки)
+_LOCK_STRIPES = 16
+
+# значение по умолчанию для _cache.get: дедлайн в прошлом, карточек нет
+_NO_ENTRY: Tuple[int, None] = (-1, None)
+
+# ключи карточек повторяются во всех записях кэша — одна строка на процесс
+_Q = sys.intern("question")
+_A = sys.intern("answer")
+
+# карточки в кэше и в ответе: неизменяемый tuple, общий для всех попаданий
+Cards = Tuple[Mapping[str, str], ...]
+
+# любые пробельные последовательности (переводы строк, табы, двойные пробелы)
+_CANON_RE = re.compile(r"\s+")
+
+
+def _canonicalize(text: str) -> str:
+    """Каноническая форма текста: тот же текст с другими пробелами -> тот же ключ кэша."""
+    return _CANON_RE.sub(" ", text.strip())
+
+
+def _freeze_cards(cards: Sequence[Mapping[str, str]]) -> Cards:
+    """Один раз при вставке в кэш: tuple вместо list — вызывающий не испортит будущие попадания."""
+    return tuple({_Q: c["question"], _A: c["answer"]} for c in cards)
+
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class FlashcardsRequest:
     """
     Запрос на генерацию карточек.
 
     text      — исходный учебный текст
     max_cards — максимальное количество карточек
+    owner     — владелец текста (user id), если известен; только тексты
+                одного владельца могут попасть в общий LLM-промпт
     """
     text: str
     max_cards: int = 5
+    owner: Optional[str] = None
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class FlashcardsResponse:
     """
     Результат генерации карточек.
 
-    cards      — список карточек (question/answer)
+    cards      — карточки (question/answer), неизменяемый tuple из кэша
     cached     — были ли данные взяты из кэша
     latency_ms — "стоимость" генерации в миллисекундах
     """
-    cards: List[Dict[str, str]]
+    cards: Sequence[Mapping[str, str]]
     cached: bool
     latency_ms: float
 
@@ -49,44 +89,128 @@ class FlashcardsService:
     - отправляем трейс в Langfuse (через trace_generation)
     """
 
-    def __init__(self, cache_ttl_seconds: int = 60):
+    def __init__(self, cache_ttl_seconds: int = 60, max_entries: int = 1024, llm_workers: int = 8):
         self._cache_ttl = cache_ttl_seconds
-        # key -> (expires_at, cards)
-        self._cache: Dict[str, Tuple[float, List[Dict[str, str]]]] = {}
+        self._ttl_ns = int(cache_ttl_seconds * 1_000_000_000)
+        self._max_entries = max(1, max_entries)
+        # key -> (expires_at_ns по time.monotonic_ns(), cards); порядок = LRU (самые старые слева)
+        self._cache: "OrderedDict[str, Tuple[int, Cards]]" = OrderedDict()
+        # один лок на _cache: get+move_to_end, вставка с вытеснением и чистка
+        # из фонового потока — это read-modify-write, GIL их не делает атомарными.
+        # Порядок захвата: страйп из _locks -> _cache_lock (никогда наоборот).
+        self._cache_lock = threading.Lock()
+        # single-flight: key -> Future генерации, которая уже идёт.
+        # Одновременные промахи по одному ключу ждут её, а не зовут модель ещё раз.
+        self._locks = [threading.Lock() for _ in range(_LOCK_STRIPES)]
+        self._inflight: Dict[str, "Future[FlashcardsResponse]"] = {}
+
+        # LLM-запросы одного пакета (generate_batch) выполняются параллельно
+        self._llm_pool = ThreadPoolExecutor(
+            max_workers=max(1, llm_workers),
+            thread_name_prefix="flashcards-llm",
+        )
+
+        # фоновая чистка протухших записей: не ждём, пока ключ спросят снова
+        self._stop = threading.Event()
+        self._sweeper = threading.Thread(
+            target=self._sweep_loop,
+            name="flashcards-cache-sweeper",
+            daemon=True,
+        )
+        self._sweeper.start()
+
+    def close(self) -> None:
+        """Остановить фоновую чистку кэша и пул LLM-запросов."""
+        self._stop.set()
+        self._llm_pool.shutdown(wait=False)
+
+    def _sweep_loop(self) -> None:
+        interval = max(1.0, self._cache_ttl / 4)
+        while not self._stop.wait(interval):
+            self._sweep_expired()
+
+    def _sweep_expired(self) -> None:
+        now = time.monotonic_ns()
+        with self._cache_lock:
+            expired = [key for key, (expires_at, _) in self._cache.items() if expires_at < now]
+            for key in expired:
+                del self._cache[key]
 
     def _make_cache_key(self, text: str, max_cards: int) -> str:
-        # Простейший ключ: hash текста + max_cards
-        return f"{hash(text)}:{max_cards}"
+        # xxh64 текста + max_cards: быстрее SipHash из hash() на длинных текстах
+        # и одинаков во всех процессах (hash() рандомизирован на процесс)
+        if xxhash is not None:
+            return f"{xxhash.xxh64_intdigest(text)}:{max_cards}"
+        return f"{hashlib.blake2b(text.encode('utf-8'), digest_size=8).hexdigest()}:{max_cards}"
+
+    def _get_from_cache(self, key: str) -> Optional[Cards]:
+        with self._cache_lock:
+            # _NO_ENTRY "протух" всегда — промах и протухание в одной ветке
+            expires_at, cards = self._cache.get(key, _NO_ENTRY)
+            if expires_at < time.monotonic_ns():
+                if cards is not None:
+                    # кэш протух — удаляем
+                    del self._cache[key]
+                return None
+
+            self._cache.move_to_end(key)
+            return cards
+
+    def _set_cache(self, key: str, cards: Cards) -> None:
+        with self._cache_lock:
+            self._cache[key] = (time.monotonic_ns() + self._ttl_ns, cards)
+            self._cache.move_to_end(key)
+            if len(self._cache) > self._max_entries:
+                self._cache.popitem(last=False)
 
-    def _get_from_cache(self, key: str) -> Optional[List[Dict[str, str]]]:
-        now = time.time()
-        entry = self._cache.get(key)
-        if not entry:
-            return None
+    def _claim(self, key: str) -> Tuple["Future[FlashcardsResponse]", bool]:
+        """
+        (future, owner). owner=True — вызывающий сам генерирует и обязан
+        вызвать _resolve; иначе достаточно дождаться future.result().
+        """
+        with self._locks[hash(key) & (_LOCK_STRIPES - 1)]:
+            fut = self._inflight.get(key)
+            if fut is not None:
+                return fut, False
 
-        expires_at, cards = entry
-        if expires_at < now:
-            # кэш протух — удаляем
-            self._cache.pop(key, None)
-            return None
+            fut = Future()
+            # повторная проверка кэша под локом: генерация могла только что завершиться
+            cached_cards = self._get_from_cache(key)
+            if cached_cards is not None:
+                fut.set_result(FlashcardsResponse(cards=cached_cards, cached=True, latency_ms=0.0))
+                return fut, False
 
-        return cards
+            self._inflight[key] = fut
+            return fut, True
 
-    def _set_cache(self, key: str, cards: List[Dict[str, str]]) -> None:
-        expires_at = time.time() + self._cache_ttl
-        self._cache[key] = (expires_at, cards)
+    def _resolve(
+        self,
+        key: str,
+        fut: "Future[FlashcardsResponse]",
+        response: Optional[FlashcardsResponse] = None,
+        exc: Optional[BaseException] = None,
+    ) -> None:
+        # результат (и кэш в _finish) выставлен до снятия ключа из _inflight
+        if exc is not None:
+            fut.set_exception(exc)
+        else:
+            fut.set_result(response)
+        with self._locks[hash(key) & (_LOCK_STRIPES - 1)]:
+            self._inflight.pop(key, None)
 
     def generate(self, request: FlashcardsRequest) -> FlashcardsResponse:
         """
         Основной метод сервиса.
 
         1) пробуем взять результат из кэша
-        2) если кэша нет — вызываем baseline-модель
-        3) шлём трейс в Langfuse (если настроен)
+        2) если тот же запрос уже генерируется в другом потоке — ждём его
+        3) иначе вызываем baseline-модель
+        4) шлём трейс в Langfuse (если настроен)
         """
-        text = request.text.strip()
+        # и ключ, и модель получают каноническую форму — кэш согласован с тем, что сгенерировано
+        text = _canonicalize(request.text)
         if not text:
-            return FlashcardsResponse(cards=[], cached=False, latency_ms=0.0)
+            return FlashcardsResponse(cards=(), cached=False, latency_ms=0.0)
 
         cache_key = self._make_cache_key(text, request.max_cards)
 
@@ -99,27 +223,166 @@ class FlashcardsService:
                 latency_ms=0.0,
             )
 
-        # 2) baseline-запрос
-        start = time.perf_counter()
-        cards_data = generate_flashcards(text, max_cards=request.max_cards)
-        latency_ms = (time.perf_counter() - start) * 1000.0
+        # 2) тот же ключ уже генерируется — ждём его результат
+        fut, owner = self._claim(cache_key)
+        if not owner:
+            return fut.result()
+
+        # 3) baseline-запрос
+        try:
+            start = time.perf_counter()
+            cards_data = generate_flashcards(text, max_cards=request.max_cards)
+            latency_ms = (time.perf_counter() - start) * 1000.0
+            response = self._finish(text, cache_key, cards_data, latency_ms)
+        except BaseException as exc:
+            self._resolve(cache_key, fut, exc=exc)
+            raise
 
-        # 3) сохраняем в кэш
-        if cards_data:
-            self._set_cache(cache_key, cards_data)
+        self._resolve(cache_key, fut, response)
+        return response
 
-        # 4) отправляем трейс (fire-and-forget)
+    def _finish(
+        self,
+        text: str,
+        cache_key: str,
+        cards_data: List[Dict[str, str]],
+        latency_ms: float,
+    ) -> FlashcardsResponse:
+        # сохраняем в кэш; промах отдаёт тот же tuple, что потом будут получать попадания
+        cards = _freeze_cards(cards_data)
+        if cards:
+            self._set_cache(cache_key, cards)
+
+        # отправляем трейс (fire-and-forget)
         try:
-            trace_generation(prompt=text, cards=cards_data)
+            trace_generation(prompt=text, cards=cards)
         except Exception as exc:  # pragma: no cover
             logger.error("Не удалось отправить трейс генерации: %r", exc)
 
         return FlashcardsResponse(
-            cards=cards_data,
+            cards=cards,
             cached=False,
             latency_ms=latency_ms,
         )
 
+    def generate_batch(
+        self, requests: List[FlashcardsRequest]
+    ) -> List[Union[FlashcardsResponse, Exception]]:
+        """
+        Пакетная генерация (для BatchingFlashcardsQueue).
+
+        Одинаковые запросы (тот же текст + max_cards) внутри пакета
+        схлопываются; уникальные промахи кэша — отдельный LLM-запрос на текст,
+        запросы выполняются параллельно. С LLM_PROMPT_BATCHING=1 тексты
+        одного owner уходят одним промптом (generate_flashcards_many);
+        тексты разных пользователей в один промпт не попадают никогда.
+
+        Результаты возвращаются в порядке входного списка: FlashcardsResponse
+        или исключение своего LLM-запроса — упавший запрос не валит остальные.
+        """
+        unique: Dict[str, Tuple[str, int]] = {}
+        owners: Dict[str, Optional[str]] = {}
+        keys: List[str] = []
+        for req in requests:
+            text = _canonicalize(req.text)
+            key = self._make_cache_key(text, req.max_cards)
+            keys.append(key)
+            if key not in unique:
+                unique[key] = (text, req.max_cards)
+                owners[key] = req.owner
+
+        results: Dict[str, Union[FlashcardsResponse, Exception]] = {}
+        misses: List[str] = []
+        for key, (text, _) in unique.items():
+            if not text:
+                results[key] = FlashcardsResponse(cards=(), cached=False, latency_ms=0.0)
+                continue
+            cached_cards = self._get_from_cache(key)
+            if cached_cards is not None:
+                results[key] = FlashcardsResponse(cards=cached_cards, cached=True, latency_ms=0.0)
+            else:
+                misses.append(key)
+
+        owned: Dict[str, "Future[FlashcardsResponse]"] = {}
+        waiting: Dict[str, "Future[FlashcardsResponse]"] = {}
+        for key in misses:
+            fut, owner = self._claim(key)
+            (owned if owner else waiting)[key] = fut
+
+        if owned:
+            jobs = self._llm_jobs(list(owned), owners)
+            try:
+                if len(jobs) == 1:
+                    items = [unique[key] for key in jobs[0]]
+                    self._finish_job(jobs[0], lambda: self._run_job(items), unique, results)
+                else:
+                    futures = [self._llm_pool.submit(self._run_job, [unique[key] for key in job]) for job in jobs]
+                    # каждый Future разбирается отдельно: упавший не отменяет остальные
+                    for job, job_fut in zip(jobs, futures):
+                        self._finish_job(job, job_fut.result, unique, results)
+            except BaseException as exc:
+                # KeyboardInterrupt/SystemExit: не оставляем ждущих без результата
+                for key, fut in owned.items():
+                    self._resolve(key, fut, *self._outcome(results.get(key, exc)))
+                raise
+            for key, fut in owned.items():
+                self._resolve(key, fut, *self._outcome(results[key]))
+
+        for key, fut in waiting.items():
+            exc = fut.exception()
+            results[key] = exc if exc is not None else fut.result()
+
+        return [results[key] for key in keys]
 
-# Глобальный "ленивый" экземпляр сервиса, которым можно пользоваться из кода.
-flashcards_service = FlashcardsService(cache_ttl_seconds=60)
+    def _finish_job(
+        self,
+        job: List[str],
+        run: Callable[[], Tuple[List[List[Dict[str, str]]], float]],
+        unique: Dict[str, Tuple[str, int]],
+        results: Dict[str, Union[FlashcardsResponse, Exception]],
+    ) -> None:
+        """Результат одного LLM-запроса -> results; его исключение — только его ключам."""
+        try:
+            generated, latency_ms = run()
+            if len(generated) != len(job):
+                raise RuntimeError(f"LLM вернул {len(generated)} результатов на {len(job)} текстов")
+            for key, cards_data in zip(job, generated):
+                results[key] = self._finish(unique[key][0], key, cards_data, latency_ms)
+        except Exception as exc:
+            logger.error("LLM-запрос пакета упал (%d текстов): %r", len(job), exc)
+            for key in job:
+                results.setdefault(key, exc)
+
+    @staticmethod
+    def _outcome(
+        result: Union[FlashcardsResponse, BaseException],
+    ) -> Tuple[Optional[FlashcardsResponse], Optional[BaseException]]:
+        if isinstance(result, BaseException):
+            return None, result
+        return result, None
+
+    @staticmethod
+    def _llm_jobs(keys: List[str], owners: Dict[str, Optional[str]]) -> List[List[str]]:
+        """Ключи, которые можно отправить одним LLM-запросом: только один owner."""
+        if not LLM_PROMPT_BATCHING:
+            return [[key] for key in keys]
+        jobs: List[List[str]] = []
+        by_owner: Dict[str, List[str]] = {}
+        for key in keys:
+            owner = owners[key]
+            if owner is None:
+                jobs.append([key])
+            else:
+                by_owner.setdefault(owner, []).append(key)
+        jobs.extend(by_owner.values())
+        return jobs
+
+    @staticmethod
+    def _run_job(items: List[Tuple[str, int]]) -> Tuple[List[List[Dict[str, str]]], float]:
+        start = time.perf_counter()
+        if len(items) == 1:
+            text, max_cards = items[0]
+            generated = [generate_flashcards(text, max_cards=max_cards)]
+        else:
+            generated = generate_flashcards_many(items)
+        return generated, (time.perf_counter() - start) * 1000.0
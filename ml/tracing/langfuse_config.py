@@ -10,14 +10,22 @@
 
 Теперь вместо простого logging используем официальный Langfuse Python SDK,
 который работает поверх публичного API /api/public (см. Public API docs).
+
+Включён ли Langfuse, решается один раз при импорте: если клиента нет
+(SDK не установлен, нет ключей или LANGFUSE_ENABLED=0), обе публичные
+функции подменяются на заглушки, которые только пишут в logging.
 """
 
 from __future__ import annotations
 
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Tuple
+import atexit
+import functools
 import logging
 import os
 import json
+import queue
+import threading
 
 logger = logging.getLogger(__name__)
 
@@ -32,7 +40,25 @@ except Exception:  # ImportError и любые другие проблемы п
     get_client = None  # type: ignore[assignment]
 
 
-_langfuse_client = None  # кэшированный экземпляр клиента
+_DEFAULT_MODEL = "gpt-4o-mini"
+
+# LANGFUSE_ENABLED=0 отключает трассировку, не удаляя ключи из окружения
+LANGFUSE_ENABLED = os.getenv("LANGFUSE_ENABLED", "1").strip().lower() not in ("0", "false", "no", "off")
+
+# metadata=None -> один общий пустой dict (только читается: лог и сериализация SDK)
+_EMPTY_META: Dict[str, Any] = {}
+
+
+class _LazyJSON:
+    """Аргумент для logger: json.dumps выполняется, только если запись реально пишется."""
+
+    __slots__ = ("payload",)
+
+    def __init__(self, payload: Any):
+        self.payload = payload
+
+    def __str__(self) -> str:
+        return json.dumps(self.payload, ensure_ascii=False)
 
 
 def _init_client():
@@ -44,6 +70,10 @@ def _init_client():
 
     Если SDK не установлен или ключи не заданы — возвращаем None и не ломаем приложение.
     """
+    if not LANGFUSE_ENABLED:
+        logger.info("LANGFUSE_ENABLED=0 — Langfuse-трассировка отключена.")
+        return None
+
     if not _LANGFUSE_AVAILABLE:
         logger.warning("Langfuse SDK не установлен. Используем только стандартный logging.")
         return None
@@ -69,12 +99,15 @@ def _init_client():
         return None
 
 
+@functools.lru_cache(maxsize=1)
 def _get_client():
-    """Глобальный доступ к клиенту с ленивой инициализацией и кешированием."""
-    global _langfuse_client
-    if _langfuse_client is None:
-        _langfuse_client = _init_client()
-    return _langfuse_client
+    """
+    Глобальный доступ к клиенту с ленивой инициализацией и кешированием.
+
+    Кешируется и None (Langfuse не настроен): иначе _init_client и его
+    предупреждение повторялись бы на каждый трейс.
+    """
+    return _init_client()
 
 
 def log_llm_call(
@@ -96,27 +129,22 @@ def log_llm_call(
       2) если клиент есть — создаём наблюдение типа "generation" в Langfuse,
          чтобы в дашборде были видны prompt, ответ/ошибка и метаданные.
     """
+    client = _get_client()
+    if client is None:
+        return _log_llm_call_disabled(prompt, response, error, metadata)
+
+    meta = metadata or _EMPTY_META
     payload = {
         "prompt": prompt,
         "response": response,
         "error": error,
-        "metadata": metadata or {},
+        "metadata": meta,
     }
 
-    client = _get_client()
-
-    if client is None:
-        # Fallback: старое поведение — только logging
-        logger.info(
-            "[Langfuse disabled] LLM call: %s",
-            json.dumps(payload, ensure_ascii=False),
-        )
-        return None
-
     try:
         # Пример использования start_as_current_observation из SDK:
         # https://langfuse.com/docs/observability/sdk/python/overview
-        model_name = (metadata or {}).get("model", "gpt-4o-mini")
+        model_name = meta.get("model", _DEFAULT_MODEL)
 
         with client.start_as_current_observation(
             as_type="generation",
@@ -128,12 +156,12 @@ def log_llm_call(
                 generation.update(
                     output={"error": error},
                     level="error",
-                    metadata=(metadata or {}),
+                    metadata=meta,
                 )
             else:
                 generation.update(
                     output=response,
-                    metadata=(metadata or {}),
+                    metadata=meta,
                 )
 
     except Exception as exc:  # pragma: no cover
@@ -141,35 +169,48 @@ def log_llm_call(
         logger.error("Не удалось отправить данные о LLM-вызове в Langfuse: %r", exc)
         logger.info(
             "[Langfuse fallback] LLM call (local log only): %s",
-            json.dumps(payload, ensure_ascii=False),
+            _LazyJSON(payload),
         )
 
     return None
 
 
-def trace_generation(prompt: str, cards: List[Dict[str, str]]) -> None:
-    """
-    Трассировка сценария "Generate Flashcards" для Langfuse.
-
-    :param prompt: исходный текст, по которому генерировались карточки;
-    :param cards: список карточек (question/answer), которые вернула baseline-модель.
-    """
+def _log_llm_call_disabled(
+    prompt: str,
+    response: Optional[str] = None,
+    error: Optional[str] = None,
+    metadata: Optional[Dict[str, Any]] = None,
+) -> None:
+    # Fallback: старое поведение — только logging
+    if not logger.isEnabledFor(logging.INFO):
+        return None
     payload = {
-        "event": "generate_flashcards",
         "prompt": prompt,
-        "cards": cards,
-        "cards_count": len(cards),
+        "response": response,
+        "error": error,
+        "metadata": metadata or _EMPTY_META,
     }
+    logger.info(
+        "[Langfuse disabled] LLM call: %s",
+        _LazyJSON(payload),
+    )
+    return None
 
-    client = _get_client()
 
-    if client is None:
-        logger.info(
-            "[Langfuse disabled] Generation trace: %s",
-            json.dumps(payload, ensure_ascii=False),
-        )
-        return None
+# ---------- асинхронная отправка трейсов генерации ----------
+# Запросный поток только кладёт (prompt, cards) в очередь; спаны создаёт
+# один фоновый поток, пачками до TRACE_BATCH_MAX. Экспорт в Langfuse SDK
+# и так батчевый — так из запроса уходит и сама работа по созданию спанов.
+TRACE_QUEUE_MAX = int(os.getenv("LANGFUSE_TRACE_QUEUE_MAX", "10000"))
+TRACE_BATCH_MAX = 100
 
+_trace_queue: "queue.Queue[Tuple[str, List[Dict[str, str]]]]" = queue.Queue(maxsize=TRACE_QUEUE_MAX)
+_trace_worker: Optional[threading.Thread] = None
+_trace_worker_lock = threading.Lock()
+
+
+def _send_generation_trace(client, prompt: str, cards: List[Dict[str, str]]) -> None:
+    cards_count = len(cards)
     try:
         # В v3 SDK нельзя передавать tags напрямую в start_as_current_observation,
         # вместо этого используем update_trace(tags=[...]) после создания span.
@@ -177,7 +218,7 @@ def trace_generation(prompt: str, cards: List[Dict[str, str]]) -> None:
             as_type="span",
             name="generate-flashcards",
             input={"prompt": prompt},
-            metadata={"cards_count": len(cards)},
+            metadata={"cards_count": cards_count},
         ) as span:
             # сохраняем результат генерации
             span.update(output={"cards": cards})
@@ -185,10 +226,105 @@ def trace_generation(prompt: str, cards: List[Dict[str, str]]) -> None:
             span.update_trace(tags=["flashcards", "api"])
 
     except Exception as exc:  # pragma: no cover
+        payload = {
+            "event": "generate_flashcards",
+            "prompt": prompt,
+            "cards": cards,
+            "cards_count": cards_count,
+        }
         logger.error("Не удалось отправить трейс генерации в Langfuse: %r", exc)
         logger.info(
             "[Langfuse fallback] Generation trace (local log only): %s",
-            json.dumps(payload, ensure_ascii=False),
+            _LazyJSON(payload),
         )
 
+
+def _drain_traces(client, first: Optional[Tuple[str, List[Dict[str, str]]]] = None) -> None:
+    batch = [first] if first is not None else []
+    while len(batch) < TRACE_BATCH_MAX:
+        try:
+            batch.append(_trace_queue.get_nowait())
+        except queue.Empty:
+            break
+    for prompt, cards in batch:
+        _send_generation_trace(client, prompt, cards)
+
+
+def _trace_worker_loop(client) -> None:
+    while True:
+        _drain_traces(client, _trace_queue.get())
+
+
+def _flush_traces() -> None:
+    """atexit: дописать то, что осталось в очереди, и сбросить буфер SDK."""
+    client = _get_client()
+    if client is None:
+        return
+    while not _trace_queue.empty():
+        _drain_traces(client)
+    try:
+        client.flush()
+    except Exception as exc:  # pragma: no cover
+        logger.error("Не удалось сбросить буфер Langfuse: %r", exc)
+
+
+def _ensure_trace_worker(client) -> None:
+    global _trace_worker
+    if _trace_worker is not None:
+        return
+    with _trace_worker_lock:
+        if _trace_worker is None:
+            _trace_worker = threading.Thread(
+                target=_trace_worker_loop,
+                args=(client,),
+                name="langfuse-trace-worker",
+                daemon=True,
+            )
+            _trace_worker.start()
+            atexit.register(_flush_traces)
+
+
+def trace_generation(prompt: str, cards: List[Dict[str, str]]) -> None:
+    """
+    Трассировка сценария "Generate Flashcards" для Langfuse.
+
+    Не блокирует вызывающий поток: трейс ставится в очередь и отправляется
+    фоновым потоком. При переполнении очереди трейс отбрасывается.
+
+    :param prompt: исходный текст, по которому генерировались карточки;
+    :param cards: список карточек (question/answer), которые вернула baseline-модель.
+    """
+    client = _get_client()
+    if client is None:
+        return _trace_generation_disabled(prompt, cards)
+
+    _ensure_trace_worker(client)
+    try:
+        _trace_queue.put_nowait((prompt, cards))
+    except queue.Full:
+        logger.warning("Очередь трейсов Langfuse переполнена (%s) — трейс отброшен.", TRACE_QUEUE_MAX)
+
     return None
+
+
+def _trace_generation_disabled(prompt: str, cards: List[Dict[str, str]]) -> None:
+    if not logger.isEnabledFor(logging.INFO):
+        return None
+    payload = {
+        "event": "generate_flashcards",
+        "prompt": prompt,
+        "cards": cards,
+        "cards_count": len(cards),
+    }
+    logger.info(
+        "[Langfuse disabled] Generation trace: %s",
+        _LazyJSON(payload),
+    )
+    return None
+
+
+# Langfuse не настроен (обычный случай для локального запуска и тестов) —
+# вызывающий код сразу попадает в заглушку, без проверок клиента на каждый вызов.
+if _get_client() is None:
+    log_llm_call = _log_llm_call_disabled  # noqa: F811
+    trace_generation = _trace_generation_disabled  # noqa: F811
@@ -0,0 +1,249 @@
+# tests/test_auth.py
+"""
+Тесты backend/app/auth.py:
+- локальная проверка Supabase JWT (HS256) и hybrid-fallback на /auth/v1/user (chunk0-3);
+- кэш token -> user: TTL (не дольше exp токена), negative, LRU (chunk0-2).
+"""
+
+import asyncio
+import time
+
+import httpx
+import pytest
+from fastapi import HTTPException
+
+from backend.app import auth
+
+jwt = pytest.importorskip("jwt")
+
+SECRET = "test-jwt-secret-with-at-least-32-bytes"
+USER_URL = "https://supabase.test/auth/v1/user"
+
+
+def _token(secret: str = SECRET, algorithm: str = "HS256", **overrides) -> str:
+    claims = {
+        "sub": "user-1",
+        "email": "user-1@test.local",
+        "role": "authenticated",
+        "aud": "authenticated",
+        "exp": int(time.time()) + 3600,
+    }
+    claims.update(overrides)
+    claims = {k: v for k, v in claims.items() if v is not None}
+    return jwt.encode(claims, secret, algorithm=algorithm)
+
+
+class _FakeSupabase:
+    """httpx.AsyncClient поверх MockTransport: считает запросы к /auth/v1/user."""
+
+    def __init__(self, status_code: int = 200, user=None):
+        self.calls = 0
+        self.status_code = status_code
+        self.user = user if user is not None else {"id": "remote-user", "email": "r@test.local"}
+
+    def _handle(self, request: httpx.Request) -> httpx.Response:
+        self.calls += 1
+        return httpx.Response(self.status_code, json=self.user if self.status_code == 200 else {})
+
+    def fetch(self, authorization):
+        async def run():
+            async with httpx.AsyncClient(transport=httpx.MockTransport(self._handle)) as client:
+                return await auth._fetch_supabase_user(authorization, client)
+
+        return asyncio.run(run())
+
+
+@pytest.fixture(autouse=True)
+def auth_env(monkeypatch):
+    monkeypatch.setattr(auth, "_SUPABASE_USER_URL", USER_URL)
+    monkeypatch.setattr(auth, "_SUPABASE_KEY", "anon-key")
+    monkeypatch.setattr(auth, "_SUPABASE_JWT_SECRET", SECRET)
+    monkeypatch.setattr(auth, "_LOCAL_JWT_ENABLED", True)
+    monkeypatch.setattr(auth, "_AUTH_MODE", "hybrid")
+    monkeypatch.setattr(auth, "_USER_CACHE", type(auth._USER_CACHE)())
+    monkeypatch.setattr(auth, "AUTH_CACHE_TTL", 60)
+    monkeypatch.setattr(auth, "AUTH_CACHE_NEGATIVE_TTL", 5)
+
+
+# ---------- local JWT ----------
+
+def test_local_jwt_accepted():
+    user = auth._decode_local_user(_token(user_metadata={"name": "A"}), SECRET)
+    assert user == {
+        "id": "user-1",
+        "email": "user-1@test.local",
+        "role": "authenticated",
+        "user_metadata": {"name": "A"},
+        "app_metadata": {},
+    }
+
+
+@pytest.mark.parametrize(
+    "token",
+    [
+        pytest.param(lambda: _token(secret="another-secret-with-at-least-32-bytes"), id="wrong-secret"),
+        pytest.param(lambda: _token(exp=int(time.time()) - 60), id="expired"),
+        pytest.param(lambda: _token(aud="anon"), id="wrong-audience"),
+        pytest.param(lambda: _token(aud=None), id="no-audience"),
+        pytest.param(lambda: _token(sub=None), id="no-sub"),
+        pytest.param(lambda: "not-a-jwt", id="garbage"),
+    ],
+)
+def test_local_jwt_rejected(token):
+    with pytest.raises(HTTPException) as exc_info:
+        auth._decode_local_user(token(), SECRET)
+    assert exc_info.value.status_code == 401
+
+
+def test_local_jwt_other_algorithm_is_not_decoded():
+    assert auth._decode_local_user(_token(algorithm="HS512"), SECRET) is None
+
+
+def test_hybrid_local_token_skips_network():
+    supabase = _FakeSupabase()
+    user = supabase.fetch(f"Bearer {_token()}")
+    assert user["id"] == "user-1"
+    assert supabase.calls == 0
+
+
+def test_hybrid_invalid_local_token_is_not_sent_remote():
+    supabase = _FakeSupabase()
+    with pytest.raises(HTTPException) as exc_info:
+        supabase.fetch(f"Bearer {_token(exp=int(time.time()) - 60)}")
+    assert exc_info.value.status_code == 401
+    assert supabase.calls == 0
+
+
+def test_hybrid_falls_back_to_remote_for_other_algorithm():
+    supabase = _FakeSupabase()
+    assert supabase.fetch(f"Bearer {_token(algorithm='HS512')}")["id"] == "remote-user"
+    assert supabase.calls == 1
+
+
+def test_local_mode_rejects_other_algorithm(monkeypatch):
+    monkeypatch.setattr(auth, "_AUTH_MODE", "local")
+    supabase = _FakeSupabase()
+    with pytest.raises(HTTPException) as exc_info:
+        supabase.fetch(f"Bearer {_token(algorithm='HS512')}")
+    assert exc_info.value.status_code == 401
+    assert supabase.calls == 0
+
+
+def test_remote_mode_ignores_secret(monkeypatch):
+    monkeypatch.setattr(auth, "_AUTH_MODE", "remote")
+    supabase = _FakeSupabase()
+    assert supabase.fetch(f"Bearer {_token()}")["id"] == "remote-user"
+    assert supabase.calls == 1
+
+
+@pytest.mark.parametrize("header", [None, "", "Token abc", "Bearer", "Bearer   "])
+def test_malformed_authorization_header(header):
+    supabase = _FakeSupabase()
+    with pytest.raises(HTTPException) as exc_info:
+        supabase.fetch(header)
+    assert exc_info.value.status_code == 401
+    assert supabase.calls == 0
+
+
+# ---------- token -> user cache ----------
+
+@pytest.fixture
+def remote_mode(monkeypatch):
+    monkeypatch.setattr(auth, "_AUTH_MODE", "remote")
+
+
+@pytest.mark.usefixtures("remote_mode")
+def test_remote_user_is_cached():
+    supabase = _FakeSupabase()
+    assert supabase.fetch("Bearer opaque") == supabase.fetch("Bearer opaque")
+    assert supabase.calls == 1
+
+
+@pytest.mark.usefixtures("remote_mode")
+@pytest.mark.parametrize("status_code", [401, 403])
+def test_rejected_token_is_negatively_cached(status_code):
+    supabase = _FakeSupabase(status_code=status_code)
+    for _ in range(3):
+        with pytest.raises(HTTPException) as exc_info:
+            supabase.fetch("Bearer revoked")
+        assert exc_info.value.status_code == 401
+    assert supabase.calls == 1
+
+
+@pytest.mark.usefixtures("remote_mode")
+def test_upstream_error_is_not_cached():
+    supabase = _FakeSupabase(status_code=500)
+    for _ in range(2):
+        with pytest.raises(HTTPException):
+            supabase.fetch("Bearer opaque")
+    assert supabase.calls == 2
+
+
+@pytest.mark.usefixtures("remote_mode")
+def test_negative_cache_disabled_with_zero_ttl(monkeypatch):
+    monkeypatch.setattr(auth, "AUTH_CACHE_NEGATIVE_TTL", 0)
+    supabase = _FakeSupabase(status_code=401)
+    for _ in range(2):
+        with pytest.raises(HTTPException):
+            supabase.fetch("Bearer revoked")
+    assert supabase.calls == 2
+
+
+@pytest.mark.usefixtures("remote_mode")
+def test_cache_entry_expires(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(auth.time, "monotonic", lambda: now[0])
+    supabase = _FakeSupabase()
+
+    supabase.fetch("Bearer opaque")
+    now[0] += auth.AUTH_CACHE_TTL - 1
+    supabase.fetch("Bearer opaque")
+    assert supabase.calls == 1
+
+    now[0] += 2
+    supabase.fetch("Bearer opaque")
+    assert supabase.calls == 2
+
+
+@pytest.mark.usefixtures("remote_mode")
+def test_cache_evicts_least_recently_used(monkeypatch):
+    monkeypatch.setattr(auth, "AUTH_CACHE_MAXSIZE", 2)
+    supabase = _FakeSupabase()
+
+    supabase.fetch("Bearer a")
+    supabase.fetch("Bearer b")
+    supabase.fetch("Bearer a")  # a теперь свежее b
+    supabase.fetch("Bearer c")  # вытесняет b
+    assert supabase.calls == 3
+    assert len(auth._USER_CACHE) == 2
+
+    supabase.fetch("Bearer a")
+    assert supabase.calls == 3
+    supabase.fetch("Bearer b")
+    assert supabase.calls == 4
+
+
+@pytest.mark.usefixtures("remote_mode")
+def test_cached_user_does_not_outlive_token(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(auth.time, "monotonic", lambda: now[0])
+    supabase = _FakeSupabase()
+    token = _token(exp=int(time.time()) + 10)  # раньше, чем AUTH_CACHE_TTL=60
+
+    supabase.fetch(f"Bearer {token}")
+    now[0] += 5
+    supabase.fetch(f"Bearer {token}")
+    assert supabase.calls == 1
+
+    now[0] += 6
+    supabase.fetch(f"Bearer {token}")
+    assert supabase.calls == 2
+
+
+@pytest.mark.usefixtures("remote_mode")
+def test_expired_token_is_not_cached():
+    supabase = _FakeSupabase()
+    token = _token(exp=int(time.time()) - 1)
+    supabase.fetch(f"Bearer {token}")
+    supabase.fetch(f"Bearer {token}")
+    assert supabase.calls == 2
@@ -0,0 +1,143 @@
+# tests/test_batching.py
+"""
+Юнит-тесты BatchingFlashcardsQueue (ml/service/batching.py, chunk0-10):
+коалесцирование запросов в пакеты, ошибка — только у своих запросов,
+остановка без зависших вызывающих.
+"""
+
+import asyncio
+import threading
+import time
+
+from ml.service.batching import BatchingFlashcardsQueue
+from ml.service.flashcards_service import FlashcardsRequest, FlashcardsResponse
+
+
+class FakeService:
+    """generate_batch/generate без модели: карточка = текст запроса."""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.batches = []
+        self.lock = threading.Lock()
+
+    def _response(self, req: FlashcardsRequest) -> FlashcardsResponse:
+        return FlashcardsResponse(cards=({"question": req.text, "answer": "a"},), cached=False, latency_ms=1.0)
+
+    def generate_batch(self, requests):
+        with self.lock:
+            self.batches.append([r.text for r in requests])
+        time.sleep(self.delay)
+        return [self._response(r) for r in requests]
+
+    def generate(self, request):
+        return self._response(request)
+
+
+def test_concurrent_submits_share_one_batch():
+    service = FakeService()
+
+    async def scenario():
+        queue = BatchingFlashcardsQueue(service, max_batch=8, max_wait_ms=50)
+        queue.start()
+        try:
+            return await asyncio.gather(*(queue.submit(FlashcardsRequest(text=t)) for t in "abc"))
+        finally:
+            await queue.stop()
+
+    results = asyncio.run(scenario())
+
+    # каждый получил свой результат, в своём порядке
+    assert [r.cards[0]["question"] for r in results] == ["a", "b", "c"]
+    assert service.batches == [["a", "b", "c"]]
+
+
+def test_batch_is_capped_by_max_batch():
+    service = FakeService()
+
+    async def scenario():
+        queue = BatchingFlashcardsQueue(service, max_batch=2, max_wait_ms=50)
+        queue.start()
+        try:
+            await asyncio.gather(*(queue.submit(FlashcardsRequest(text=t)) for t in "abcde"))
+        finally:
+            await queue.stop()
+
+    asyncio.run(scenario())
+
+    assert sorted(len(b) for b in service.batches) == [1, 2, 2]
+
+
+def test_submit_without_consumer_calls_service_directly():
+    service = FakeService()
+    queue = BatchingFlashcardsQueue(service)
+
+    result = asyncio.run(queue.submit(FlashcardsRequest(text="solo")))
+
+    assert result.cards[0]["question"] == "solo"
+    assert service.batches == []
+
+
+def test_stop_waits_for_dispatched_and_fails_collected():
+    service = FakeService(delay=0.2)
+
+    async def scenario():
+        queue = BatchingFlashcardsQueue(service, max_batch=2, max_wait_ms=500)
+        queue.start()
+        dispatched = [asyncio.create_task(queue.submit(FlashcardsRequest(text=t))) for t in "ab"]
+        await asyncio.sleep(0.05)
+        # "c" забран из очереди, пакет ещё собирается (окно 500 мс)
+        collecting = asyncio.create_task(queue.submit(FlashcardsRequest(text="c")))
+        await asyncio.sleep(0.05)
+
+        await asyncio.wait_for(queue.stop(), timeout=2)
+        return (
+            await asyncio.wait_for(asyncio.gather(*dispatched), timeout=1),
+            await asyncio.wait_for(asyncio.gather(collecting, return_exceptions=True), timeout=1),
+        )
+
+    done, (failed,) = asyncio.run(scenario())
+
+    assert [r.cards[0]["question"] for r in done] == ["a", "b"]
+    assert isinstance(failed, RuntimeError)
+
+
+def test_batch_error_reaches_every_caller():
+    class Broken(FakeService):
+        def generate_batch(self, requests):
+            raise ValueError("model down")
+
+    async def scenario():
+        queue = BatchingFlashcardsQueue(Broken(), max_batch=8, max_wait_ms=20)
+        queue.start()
+        try:
+            return await asyncio.gather(
+                *(queue.submit(FlashcardsRequest(text=t)) for t in "ab"), return_exceptions=True
+            )
+        finally:
+            await queue.stop()
+
+    results = asyncio.run(scenario())
+
+    assert all(isinstance(r, ValueError) for r in results)
+
+
+def test_failed_request_does_not_fail_the_batch():
+    class OneBad(FakeService):
+        def generate_batch(self, requests):
+            return [ValueError("model down") if r.text == "bad" else self._response(r) for r in requests]
+
+    async def scenario():
+        queue = BatchingFlashcardsQueue(OneBad(), max_batch=8, max_wait_ms=20)
+        queue.start()
+        try:
+            return await asyncio.gather(
+                *(queue.submit(FlashcardsRequest(text=t)) for t in ("a", "bad", "b")), return_exceptions=True
+            )
+        finally:
+            await queue.stop()
+
+    a, bad, b = asyncio.run(scenario())
+
+    assert isinstance(bad, ValueError)
+    assert (a.cards[0]["question"], b.cards[0]["question"]) == ("a", "b")
@@ -6,31 +6,25 @@
 - список колод (UC-1)
 - создание новой колоды (UC-1 / UC-2)
 - получение колоды по ID
+- сохранение карточек одним запросом /decks/{id}/cards/bulk (chunk2-15)
 """
 
-from fastapi.testclient import TestClient
+import os
 
-from backend.app.main import app
-from backend.app.routers import decks as decks_module
+import pytest
 
-client = TestClient(app)
+# Колоды живут в Postgres: тесты идут против TEST_DATABASE_URL от имени
+# тестового пользователя (фикстура current_user), иначе пропускаются.
+pytestmark = [
+    pytest.mark.skipif(not os.getenv("TEST_DATABASE_URL"), reason="нужен Postgres: задайте TEST_DATABASE_URL"),
+    pytest.mark.usefixtures("db_schema", "current_user"),
+]
 
 
-def reset_decks_state() -> None:
-    """
-    Сбрасываем in-memory "базу данных" перед каждым тестом,
-    чтобы тесты были изолированы друг от друга.
-    """
-    decks_module.DECKS_DB.clear()
-    decks_module.NEXT_DECK_ID = 1
-
-
-def test_list_decks_initially_empty():
+def test_list_decks_initially_empty(client):
     """
     При старте приложения список колод должен быть пустым.
     """
-    reset_decks_state()
-
     response = client.get("/decks/")
     assert response.status_code == 200
 
@@ -39,13 +33,11 @@ def test_list_decks_initially_empty():
     assert data == []  # изначально колод нет
 
 
-def test_create_deck_and_list():
+def test_create_deck_and_list(client):
     """
     Создаём одну колоду и убеждаемся, что она появляется
     в списке /decks/.
     """
-    reset_decks_state()
-
     payload = {
         "title": "Тестовая колода",
         "description": "Короткое описание для юнит-теста",
@@ -79,12 +71,10 @@ def test_create_deck_and_list():
     assert isinstance(deck["cards"], list)
 
 
-def test_get_deck_by_id():
+def test_get_deck_by_id(client):
     """
     Проверяем, что /decks/{deck_id} возвращает созданную колоду.
     """
-    reset_decks_state()
-
     payload = {
         "title": "Колода для get_deck",
         "description": "Проверка получения колоды по ID",
@@ -104,3 +94,30 @@ def test_get_deck_by_id():
     assert deck["title"] == payload["title"]
     assert deck["description"] == payload["description"]
     assert isinstance(deck.get("cards", []), list)
+
+
+def test_create_cards_bulk(client):
+    """
+    /decks/{deck_id}/cards/bulk сохраняет все карточки одним запросом
+    и возвращает их в порядке payload.
+    """
+    deck_id = client.post("/decks/", json={"title": "Колода для bulk"}).json()["id"]
+    cards = [{"question": f"Q{i}", "answer": f"A{i}"} for i in range(3)]
+
+    resp = client.post(f"/decks/{deck_id}/cards/bulk", json={"cards": cards})
+    assert resp.status_code == 201
+
+    created = resp.json()
+    assert [(c["question"], c["answer"]) for c in created] == [(c["question"], c["answer"]) for c in cards]
+    assert all(isinstance(c["id"], int) and c["srs"] is None for c in created)
+
+    deck = client.get(f"/decks/{deck_id}").json()
+    assert sorted(c["id"] for c in deck["cards"]) == sorted(c["id"] for c in created)
+
+
+def test_create_cards_bulk_validation_and_missing_deck(client):
+    deck_id = client.post("/decks/", json={"title": "Колода для bulk"}).json()["id"]
+
+    assert client.post(f"/decks/{deck_id}/cards/bulk", json={"cards": []}).status_code == 422
+    missing = client.post("/decks/2147483647/cards/bulk", json={"cards": [{"question": "Q", "answer": "A"}]})
+    assert missing.status_code == 404
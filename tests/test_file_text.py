@@ -0,0 +1,85 @@
+# tests/test_file_text.py
+"""
+Тесты backend/app/utils/file_text.py — извлечение текста для /ai/generate-file:
+тип файла (docx > pdf > text, chunk2-4), разбор txt/docx/pdf (chunk2-1..chunk2-3,
+chunk2-6) и кэш по хэшу байтов (chunk2-7).
+"""
+
+import io
+
+import pytest
+
+from backend.app.utils import file_text
+
+
+def _docx_bytes(*paragraphs: str) -> bytes:
+    from docx import Document
+
+    doc = Document()
+    for p in paragraphs:
+        doc.add_paragraph(p)
+    buf = io.BytesIO()
+    doc.save(buf)
+    return buf.getvalue()
+
+
+def _pdf_bytes(*pages: str) -> bytes:
+    fitz = pytest.importorskip("fitz")
+    doc = fitz.open()
+    for text in pages:
+        doc.new_page().insert_text((72, 72), text)
+    return doc.tobytes()
+
+
+@pytest.mark.parametrize(
+    "filename, content_type, kind",
+    [
+        ("notes.txt", None, "text"),
+        ("notes.md", "", "text"),
+        ("notes", "text/plain", "text"),
+        ("lecture.pdf", "application/pdf", "pdf"),
+        # MIME и расширение спорят — побеждает более приоритетный тип
+        ("lecture.pdf", "text/plain", "pdf"),
+        ("notes.txt", "application/pdf", "pdf"),
+        ("essay.docx", "application/pdf", "docx"),
+        ("scan.png", "image/png", None),
+        ("archive.zip", "application/zip", None),
+    ],
+)
+def test_detect_kind(filename, content_type, kind):
+    assert file_text.detect_kind(filename, content_type) == kind
+
+
+def test_text_is_decoded_and_collapsed():
+    raw = "Первая  строка\n\nвторая\x00строка".encode("utf-8") + "é".encode("utf-8")[:1]
+    assert file_text.extract_text(raw, "text") == "Первая строка вторая строка"
+
+
+def test_docx_paragraphs():
+    raw = _docx_bytes("Photosynthesis", "   ", "makes glucose")
+    assert file_text.extract_text_from_bytes(raw, "a.docx") == "Photosynthesis makes glucose"
+
+
+def test_pdf_pages_and_char_budget():
+    raw = _pdf_bytes("page one", "page two", "page three")
+    assert file_text.extract_text(raw, "pdf") == "page one page two page three"
+    # лимит набран на первой странице — остальные не разбираются
+    assert file_text.extract_text(raw, "pdf", max_chars=5) == "page one"
+
+
+def test_unsupported_type():
+    with pytest.raises(ValueError):
+        file_text.extract_text_from_bytes(b"\x89PNG", "scan.png", "image/png")
+
+
+def test_extracted_text_is_cached(monkeypatch):
+    calls = []
+
+    def handler(raw, max_chars):
+        calls.append(raw)
+        return "text"
+
+    monkeypatch.setitem(file_text._HANDLERS, "text", handler)
+    raw = b"cache me"
+    assert file_text.extract_text(raw, "text") == file_text.extract_text(raw, "text") == "text"
+    assert len(calls) == 1
@@ -0,0 +1,279 @@
+# tests/test_flashcards_service.py
+"""
+Тесты ml/service/flashcards_service.py (модель подменяется — без LLM):
+- ключ кэша по каноническому тексту + max_cards (chunk3-1, chunk3-10);
+- TTL на monotonic_ns и фоновая чистка (chunk3-5, chunk3-4);
+- LRU с вытеснением по max_entries (chunk3-2);
+- single-flight для одновременных промахов (chunk3-3);
+- generate_batch: дубли, порядок, owner-промпты, изоляция ошибок (chunk0-10, chunk2-19).
+"""
+
+import threading
+
+import pytest
+
+import ml.service.flashcards_service as fs
+from ml.service.flashcards_service import FlashcardsRequest, FlashcardsService
+
+
+class _FakeModel:
+    """Подмена generate_flashcards: считает вызовы, может ждать сигнала."""
+
+    def __init__(self):
+        self.calls = []
+        self.release = threading.Event()
+        self.release.set()
+        self.started = threading.Event()
+
+    def __call__(self, text, max_cards=5):
+        self.calls.append(text)
+        self.started.set()
+        assert self.release.wait(5)
+        return [{"question": f"Q: {text}", "answer": "A"}][:max_cards]
+
+
+@pytest.fixture
+def model(monkeypatch):
+    fake = _FakeModel()
+    monkeypatch.setattr(fs, "generate_flashcards", fake)
+    return fake
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [10**12]
+    monkeypatch.setattr(fs.time, "monotonic_ns", lambda: now[0])
+    return now
+
+
+def _count_waiters(svc):
+    """Оборачивает _claim: семафор отпускается на каждый claim, который ждёт чужую генерацию."""
+    waiting = threading.Semaphore(0)
+    claim = svc._claim
+
+    def counting_claim(key):
+        fut, owner = claim(key)
+        if not owner:
+            waiting.release()
+        return fut, owner
+
+    svc._claim = counting_claim
+    return waiting
+
+
+def _wait_for(sem, n):
+    for _ in range(n):
+        assert sem.acquire(timeout=5)
+
+
+@pytest.fixture
+def make_service():
+    services = []
+
+    def make(**kwargs):
+        svc = FlashcardsService(**kwargs)
+        services.append(svc)
+        return svc
+
+    yield make
+    for svc in services:
+        svc.close()
+
+
+def test_second_call_is_cached(model, make_service):
+    svc = make_service()
+    first = svc.generate(FlashcardsRequest(text="photosynthesis"))
+    second = svc.generate(FlashcardsRequest(text="  photosynthesis\n"))
+
+    assert not first.cached and second.cached
+    assert second.cards is first.cards
+    assert model.calls == ["photosynthesis"]
+
+
+def test_max_cards_is_part_of_key(model, make_service):
+    svc = make_service()
+    svc.generate(FlashcardsRequest(text="t", max_cards=1))
+    assert not svc.generate(FlashcardsRequest(text="t", max_cards=2)).cached
+    assert len(model.calls) == 2
+
+
+def test_empty_text_skips_model(model, make_service):
+    resp = make_service().generate(FlashcardsRequest(text="  \n "))
+    assert resp.cards == () and not resp.cached
+    assert model.calls == []
+
+
+def test_cache_entry_expires(model, clock, make_service):
+    svc = make_service(cache_ttl_seconds=60)
+    svc.generate(FlashcardsRequest(text="t"))
+
+    clock[0] += 59 * 10**9
+    assert svc.generate(FlashcardsRequest(text="t")).cached
+
+    clock[0] += 2 * 10**9
+    assert not svc.generate(FlashcardsRequest(text="t")).cached
+    assert len(model.calls) == 2
+
+
+def test_sweeper_drops_expired_entries(model, clock, make_service):
+    svc = make_service(cache_ttl_seconds=60)
+    svc.generate(FlashcardsRequest(text="old"))
+    clock[0] += 30 * 10**9
+    svc.generate(FlashcardsRequest(text="new"))
+
+    clock[0] += 31 * 10**9
+    svc._sweep_expired()
+    assert len(svc._cache) == 1
+    assert svc.generate(FlashcardsRequest(text="new")).cached
+
+
+def test_cache_evicts_least_recently_used(model, make_service):
+    svc = make_service(max_entries=2)
+    for text in ("a", "b", "a", "c"):  # "a" освежён, "c" вытесняет "b"
+        svc.generate(FlashcardsRequest(text=text))
+    assert model.calls == ["a", "b", "c"]
+    assert len(svc._cache) == 2
+
+    assert svc.generate(FlashcardsRequest(text="a")).cached
+    assert not svc.generate(FlashcardsRequest(text="b")).cached
+
+
+def test_concurrent_misses_call_model_once(model, make_service):
+    svc = make_service()
+    waiting = _count_waiters(svc)
+    model.release.clear()
+    results = []
+
+    def worker():
+        results.append(svc.generate(FlashcardsRequest(text="same")))
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    threads[0].start()
+    assert model.started.wait(5)
+    for t in threads[1:]:
+        t.start()
+    _wait_for(waiting, 7)
+    model.release.set()
+    for t in threads:
+        t.join(5)
+
+    assert model.calls == ["same"]
+    assert len(results) == 8
+    assert len({id(r.cards) for r in results}) == 1
+    assert not svc._inflight
+
+
+def test_model_error_reaches_waiters_and_is_not_cached(monkeypatch, make_service):
+    calls = []
+    started = threading.Event()
+    release = threading.Event()
+
+    def failing(text, max_cards=5):
+        calls.append(text)
+        started.set()
+        release.wait(5)
+        raise RuntimeError("llm down")
+
+    monkeypatch.setattr(fs, "generate_flashcards", failing)
+    svc = make_service()
+    waiting = _count_waiters(svc)
+    errors = []
+
+    def worker():
+        try:
+            svc.generate(FlashcardsRequest(text="t"))
+        except RuntimeError as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=worker) for _ in range(3)]
+    threads[0].start()
+    assert started.wait(5)
+    for t in threads[1:]:
+        t.start()
+    _wait_for(waiting, 2)
+    release.set()
+    for t in threads:
+        t.join(5)
+
+    assert len(errors) == 3 and len(calls) == 1
+    assert not svc._inflight and not svc._cache
+
+
+def test_generate_batch_dedupes_and_keeps_order(model, make_service):
+    svc = make_service()
+    svc.generate(FlashcardsRequest(text="cached"))
+    model.calls.clear()
+
+    out = svc.generate_batch(
+        [
+            FlashcardsRequest(text="x"),
+            FlashcardsRequest(text="cached"),
+            FlashcardsRequest(text=" x "),
+            FlashcardsRequest(text="y"),
+        ]
+    )
+
+    assert sorted(model.calls) == ["x", "y"]
+    assert [r.cards[0]["question"] for r in out] == ["Q: x", "Q: cached", "Q: x", "Q: y"]
+    assert [r.cached for r in out] == [False, True, False, False]
+    assert svc.generate(FlashcardsRequest(text="y")).cached
+
+
+def test_llm_jobs_never_mix_owners(monkeypatch):
+    monkeypatch.setattr(fs, "LLM_PROMPT_BATCHING", True)
+    owners = {"k1": "alice", "k2": "bob", "k3": "alice", "k4": None}
+    jobs = FlashcardsService._llm_jobs(list(owners), owners)
+    assert sorted(jobs) == [["k1", "k3"], ["k2"], ["k4"]]
+
+    monkeypatch.setattr(fs, "LLM_PROMPT_BATCHING", False)
+    assert FlashcardsService._llm_jobs(list(owners), owners) == [["k1"], ["k2"], ["k3"], ["k4"]]
+
+
+def test_generate_batch_groups_texts_of_one_owner(model, monkeypatch, make_service):
+    many_calls = []
+
+    def fake_many(items):
+        many_calls.append([text for text, _ in items])
+        return [[{"question": f"Q: {text}", "answer": "A"}] for text, _ in items]
+
+    monkeypatch.setattr(fs, "LLM_PROMPT_BATCHING", True)
+    monkeypatch.setattr(fs, "generate_flashcards_many", fake_many)
+    svc = make_service()
+
+    out = svc.generate_batch(
+        [
+            FlashcardsRequest(text="a1", owner="alice"),
+            FlashcardsRequest(text="b1", owner="bob"),
+            FlashcardsRequest(text="a2", owner="alice"),
+            FlashcardsRequest(text="anon"),
+        ]
+    )
+
+    assert many_calls == [["a1", "a2"]]
+    assert sorted(model.calls) == ["anon", "b1"]
+    assert [r.cards[0]["question"] for r in out] == ["Q: a1", "Q: b1", "Q: a2", "Q: anon"]
+
+
+def test_generate_batch_isolates_failed_job(monkeypatch, make_service):
+    calls = []
+
+    def flaky(text, max_cards=5):
+        calls.append(text)
+        if text == "bad":
+            raise RuntimeError("llm down")
+        return [{"question": f"Q: {text}", "answer": "A"}]
+
+    monkeypatch.setattr(fs, "generate_flashcards", flaky)
+    svc = make_service()
+    svc.generate(FlashcardsRequest(text="cached"))
+
+    out = svc.generate_batch([FlashcardsRequest(text=t) for t in ("a", "bad", "cached", "b")])
+
+    assert isinstance(out[1], RuntimeError)
+    assert [r.cards[0]["question"] for r in (out[0], out[2], out[3])] == ["Q: a", "Q: cached", "Q: b"]
+    assert out[2].cached
+    # успешные запросы после упавшего закэшированы, упавший — нет
+    assert svc.generate(FlashcardsRequest(text="b")).cached
+    assert not svc._inflight
+    with pytest.raises(RuntimeError):
+        svc.generate(FlashcardsRequest(text="bad"))
@@ -5,18 +5,12 @@
 1. Проверяем, что /health отвечает 200 и {"status": "ok"}.
 2. Проверяем, что /ai/generate работает хотя бы в fallback-режиме,
    даже если нет ключа OPENAI_API_KEY.
+3. owner из токена доходит до FlashcardsRequest (chunk2-19).
+4. /ai/generate-file разбирает загрузку через utils/file_text.py (chunk2-1).
 """
 
-import os
 
-from fastapi.testclient import TestClient
-
-from backend.app.main import app
-
-client = TestClient(app)
-
-
-def test_health_ok():
+def test_health_ok(client):
     """
     Эндпоинт /health должен возвращать 200 и JSON {"status": "ok"}.
     """
@@ -27,16 +21,21 @@ def test_health_ok():
     assert data.get("status") == "ok"
 
 
-def test_ai_generate_fallback_works():
+def test_ai_generate_fallback_works(client, monkeypatch):
     """
     Тестируем /ai/generate в условиях, когда LLM может быть недоступен.
 
-    Мы специально удаляем переменную окружения OPENAI_API_KEY,
-    чтобы модель перешла в локальный fallback-режим и всё равно
-    вернула какие-то простые карточки.
+    Мы специально удаляем переменную окружения OPENAI_API_KEY
+    (только на время теста), а генерацию подменяем детерминированной
+    заглушкой — тест проверяет путь endpoint -> сервис -> ответ,
+    не запуская baseline-модель.
     """
-    # Удаляем ключ, если он есть, чтобы гарантированно включить fallback
-    os.environ.pop("OPENAI_API_KEY", None)
+    # Удаляем ключ, если он есть; monkeypatch вернёт окружение после теста
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    monkeypatch.setattr(
+        "ml.service.flashcards_service.generate_flashcards",
+        lambda text, max_cards=5: [{"question": "q", "answer": "a"}],
+    )
 
     payload = {
         "text": "FastAPI — это современный веб-фреймворк для Python, "
@@ -56,3 +55,72 @@ def test_ai_generate_fallback_works():
     first = cards[0]
     assert "question" in first
     assert "answer" in first
+
+
+class _CapturingQueue:
+    """Подмена BatchingFlashcardsQueue: запоминает FlashcardsRequest."""
+
+    def __init__(self):
+        self.requests = []
+
+    async def submit(self, request):
+        from ml.service.flashcards_service import FlashcardsResponse
+
+        self.requests.append(request)
+        return FlashcardsResponse(cards=({"question": "q", "answer": "a"},), cached=False, latency_ms=0.0)
+
+
+def test_ai_generate_passes_owner(client):
+    """
+    Запрос с токеном передаёт id пользователя в FlashcardsRequest.owner
+    (по нему сервис группирует тексты в один LLM-промпт); анонимный — owner=None.
+    """
+    from backend.app.auth import get_optional_user_id
+    from backend.app.main import app
+    from backend.app.routers.ai import get_flashcards_queue
+
+    queue = _CapturingQueue()
+    app.dependency_overrides[get_flashcards_queue] = lambda: queue
+    try:
+        assert client.post("/ai/generate", json={"text": "anonymous"}).status_code == 200
+
+        app.dependency_overrides[get_optional_user_id] = lambda: "user-1"
+        assert client.post("/ai/generate", json={"text": "signed in"}).status_code == 200
+    finally:
+        app.dependency_overrides.pop(get_flashcards_queue, None)
+        app.dependency_overrides.pop(get_optional_user_id, None)
+
+    assert [(r.text, r.owner) for r in queue.requests] == [("anonymous", None), ("signed in", "user-1")]
+
+
+def test_ai_generate_file_extracts_via_file_text(client, monkeypatch):
+    """
+    /ai/generate-file разбирает загрузку через backend/app/utils/file_text.py
+    и отдаёт модели извлечённый текст.
+    """
+    from backend.app.utils import file_text
+
+    seen = []
+    extract = file_text.extract_text
+
+    def spy(raw, kind, max_chars=None, digest=None):
+        seen.append(kind)
+        return extract(raw, kind, max_chars, digest)
+
+    monkeypatch.setattr("backend.app.routers.ai.extract_text", spy)
+    prompts = []
+    monkeypatch.setattr(
+        "ml.service.flashcards_service.generate_flashcards",
+        lambda text, max_cards=5: prompts.append(text) or [{"question": "q", "answer": "a"}],
+    )
+
+    response = client.post(
+        "/ai/generate-file",
+        files={"file": ("notes.txt", "Митохондрия —\n\nэнергетическая станция клетки.".encode(), "text/plain")},
+        data={"max_cards": "3"},
+        params={"refresh": "true"},
+    )
+
+    assert response.status_code == 200
+    assert seen == ["text"]
+    assert prompts == ["Митохондрия — энергетическая станция клетки."]
@@ -0,0 +1,122 @@
+# tests/test_review.py
+"""
+Интеграционные тесты для эндпоинтов /review.
+
+- ответы на карточки (одиночный и пакетный /answers/bulk, chunk1-9)
+- чужая колода недоступна: 404 вместо записи в чужой SRS (chunk1-9)
+"""
+
+import os
+import uuid
+
+import pytest
+
+from backend.app.auth import get_current_user
+from backend.app.main import app
+
+pytestmark = [
+    pytest.mark.skipif(not os.getenv("TEST_DATABASE_URL"), reason="нужен Postgres: задайте TEST_DATABASE_URL"),
+    pytest.mark.usefixtures("db_schema"),
+]
+
+
+@pytest.fixture
+def deck_with_cards(client, current_user):
+    deck = client.post("/decks/", json={"title": "Review deck"}).json()
+    cards = [
+        client.post(f"/decks/{deck['id']}/cards", json={"question": f"Q{i}", "answer": f"A{i}"}).json()
+        for i in range(3)
+    ]
+    return deck, cards
+
+
+@pytest.fixture
+def as_other_user(current_user):
+    """Запросы от имени другого пользователя до конца теста."""
+    other = {"id": str(uuid.uuid4()), "email": "other@test.local"}
+    app.dependency_overrides[get_current_user] = lambda: other
+    yield other
+    app.dependency_overrides[get_current_user] = lambda: current_user
+
+
+def test_answer_updates_srs(client, deck_with_cards):
+    deck, cards = deck_with_cards
+
+    resp = client.post("/review/answer", json={"deck_id": deck["id"], "card_id": cards[0]["id"], "grade": 5})
+    assert resp.status_code == 200
+    assert resp.json()["success"] is True
+
+    card = client.get(f"/decks/{deck['id']}").json()["cards"][0]
+    assert card["srs"]["repetitions"] == 1
+    assert card["srs"]["interval"] == 1
+    assert card["srs"]["ease_factor"] == pytest.approx(2.6)
+
+
+def test_answers_bulk(client, deck_with_cards):
+    deck, cards = deck_with_cards
+    answers = [{"card_id": c["id"], "grade": 4} for c in cards] + [{"card_id": cards[0]["id"], "grade": 3}]
+
+    resp = client.post("/review/answers/bulk", json={"deck_id": deck["id"], "answers": answers})
+    assert resp.status_code == 200
+    assert resp.json()["processed"] == 4
+
+    srs = {c["id"]: c["srs"] for c in client.get(f"/decks/{deck['id']}").json()["cards"]}
+    # ответы применяются по порядку: первая карточка прошла два повторения
+    assert srs[cards[0]["id"]]["repetitions"] == 2
+    assert srs[cards[0]["id"]]["interval"] == 6
+    assert srs[cards[1]["id"]]["repetitions"] == 1
+
+
+def test_answers_bulk_rejects_foreign_card(client, deck_with_cards):
+    deck, cards = deck_with_cards
+    answers = [{"card_id": cards[0]["id"], "grade": 4}, {"card_id": 2_000_000_000, "grade": 4}]
+
+    resp = client.post("/review/answers/bulk", json={"deck_id": deck["id"], "answers": answers})
+    assert resp.status_code == 404
+
+
+def test_other_user_cannot_review_deck(client, deck_with_cards, as_other_user):
+    deck, cards = deck_with_cards
+
+    single = client.post("/review/answer", json={"deck_id": deck["id"], "card_id": cards[0]["id"], "grade": 5})
+    bulk = client.post(
+        "/review/answers/bulk",
+        json={"deck_id": deck["id"], "answers": [{"card_id": cards[0]["id"], "grade": 5}]},
+    )
+    nxt = client.get("/review/next", params={"deck_id": deck["id"]})
+
+    assert single.status_code == 404
+    assert bulk.status_code == 404
+    assert nxt.status_code == 404
+
+
+def test_delete_reviewed_deck_removes_everything(client, deck_with_cards):
+    """Удаление колоды с ответами — каскад в Postgres: карточки, SRS, сессии, ответы (chunk2-10)."""
+    from sqlalchemy import text
+
+    from backend.db import engine
+
+    deck, cards = deck_with_cards
+    answers = [{"card_id": c["id"], "grade": 4} for c in cards]
+    assert client.post("/review/answers/bulk", json={"deck_id": deck["id"], "answers": answers}).status_code == 200
+
+    assert client.delete(f"/decks/{deck['id']}").status_code == 204
+    assert client.get(f"/decks/{deck['id']}").status_code == 404
+
+    ids = [c["id"] for c in cards]
+    with engine.connect() as conn:
+        left = conn.execute(
+            text(
+                "SELECT (SELECT COUNT(*) FROM cards WHERE id = ANY(:ids))"
+                " + (SELECT COUNT(*) FROM card_srs WHERE card_id = ANY(:ids))"
+                " + (SELECT COUNT(*) FROM review_answers WHERE card_id = ANY(:ids))"
+                " + (SELECT COUNT(*) FROM review_sessions WHERE deck_id = :deck_id)"
+            ),
+            {"ids": ids, "deck_id": deck["id"]},
+        ).scalar()
+    assert left == 0
+
+
+def test_other_user_cannot_delete_deck(client, deck_with_cards, as_other_user):
+    deck, _ = deck_with_cards
+    assert client.delete(f"/decks/{deck['id']}").status_code == 404
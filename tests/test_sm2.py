@@ -0,0 +1,139 @@
+# tests/test_sm2.py
+"""
+Юнит-тесты SM-2 (backend/app/routers/review.py: sm2_update):
+целочисленные интервалы (chunk1-12) и EF в сотых, SMALLINT (chunk2-14).
+
+EF хранится в сотых (SMALLINT): сравниваем с прежней float-формулой
+на всех последовательностях оценок 0..5. Эталон считается в Fraction —
+float-версия отличалась от него только ошибкой округления (см.
+test_float_formula_overshoots_exact_products).
+"""
+
+import itertools
+from datetime import date, timedelta
+from fractions import Fraction
+from math import ceil
+
+import pytest
+
+from backend.app.routers.review import sm2_update
+from backend.db import CardSRS
+
+TODAY = date(2024, 1, 1)
+
+
+# прежняя таблица (float) и она же в точной арифметике
+_EF_DELTA_FLOAT = tuple(0.1 - (5 - q) * (0.08 + (5 - q) * 0.02) for q in range(6))
+_EF_DELTA_EXACT = tuple(
+    Fraction(1, 10) - (5 - q) * (Fraction(8, 100) + (5 - q) * Fraction(2, 100)) for q in range(6)
+)
+
+
+def _sm2_float(interval: int, repetitions: int, ef, grade: int):
+    """Прежняя реализация sm2_update (EF — float); с Fraction — точный эталон."""
+    if grade < 3:
+        repetitions = 0
+        interval = 1
+    else:
+        repetitions += 1
+        if repetitions == 1:
+            interval = 1
+        elif repetitions == 2:
+            interval = 6
+        else:
+            interval = max(1, int(ceil(interval * ef)))
+    if isinstance(ef, Fraction):
+        ef = max(Fraction(13, 10), ef + _EF_DELTA_EXACT[grade])
+    else:
+        ef = max(1.3, ef + _EF_DELTA_FLOAT[grade])
+    return interval, repetitions, ef
+
+
+def _new_srs(interval: int = 0, repetitions: int = 0, ease_factor_q: int = 250) -> CardSRS:
+    return CardSRS(
+        card_id=1,
+        interval=interval,
+        repetitions=repetitions,
+        ease_factor_q=ease_factor_q,
+        next_review=None,
+        last_grade=None,
+    )
+
+
+@pytest.mark.parametrize("first", range(6))
+def test_matches_float_formula(first):
+    # все последовательности из 5 оценок, начинающиеся с first
+    for tail in itertools.product(range(6), repeat=4):
+        srs = _new_srs()
+        interval, repetitions, ef = 0, 0, Fraction(5, 2)
+        old = (0, 0, 2.5)
+
+        for grade in (first, *tail):
+            sm2_update(srs, grade, TODAY)
+            interval, repetitions, ef = _sm2_float(interval, repetitions, ef, grade)
+            old = _sm2_float(*old, grade)
+
+            # EF прежней формулы совпадает до float-шума; интервал — до её ceil-ошибок
+            assert srs.ease_factor == pytest.approx(old[2], abs=1e-9)
+
+            assert srs.repetitions == repetitions
+            assert srs.interval == interval
+            assert srs.ease_factor_q == ef * 100
+            assert srs.next_review == TODAY + timedelta(days=interval)
+            assert srs.last_grade == grade
+
+
+@pytest.mark.parametrize("grade, delta_q", [(0, -80), (1, -54), (2, -32), (3, -14), (4, 0), (5, 10)])
+def test_ease_factor_delta_per_grade(grade, delta_q):
+    srs = _new_srs(ease_factor_q=250)
+    sm2_update(srs, grade, TODAY)
+    assert srs.ease_factor_q == 250 + delta_q
+
+
+def test_float_formula_overshoots_exact_products():
+    # float: 2.5 -> 1.7 -> 1.3 -> 1.4 -> 1.5000000000000002, и 6 * EF = 9.000...01 -> 10;
+    # в сотых 6 * 150 / 100 = 9 ровно
+    interval, repetitions, ef = 0, 0, 2.5
+    for grade in (0, 0, 5, 5, 3):
+        interval, repetitions, ef = _sm2_float(interval, repetitions, ef, grade)
+    assert interval == 10
+
+    srs = _new_srs()
+    for grade in (0, 0, 5, 5, 3):
+        sm2_update(srs, grade, TODAY)
+    assert srs.interval == 9
+
+
+def test_ease_factor_floor():
+    srs = _new_srs(ease_factor_q=140)
+    for _ in range(3):
+        sm2_update(srs, 0, TODAY)
+        assert srs.ease_factor_q == 130
+    assert srs.ease_factor == pytest.approx(1.3)
+
+
+def test_interval_rounds_up():
+    # 6 * 2.36 = 14.16 -> 15 дней
+    srs = _new_srs(interval=6, repetitions=2, ease_factor_q=236)
+    sm2_update(srs, 4, TODAY)
+    assert srs.interval == 15
+
+
+def test_interval_exact_product_is_not_rounded_up():
+    # 25 * 2.36 = 59 ровно: в сотых нет float-ошибки, ceil не добавляет день
+    srs = _new_srs(interval=25, repetitions=3, ease_factor_q=236)
+    sm2_update(srs, 4, TODAY)
+    assert srs.interval == 59
+
+
+def test_interval_is_capped_to_smallint():
+    srs = _new_srs(interval=30000, repetitions=5, ease_factor_q=250)
+    sm2_update(srs, 5, TODAY)
+    assert srs.interval == 32767
+
+
+def test_failed_answer_resets_progress():
+    srs = _new_srs(interval=40, repetitions=5, ease_factor_q=250)
+    sm2_update(srs, 2, TODAY)
+    assert (srs.repetitions, srs.interval) == (0, 1)
+    assert srs.next_review == TODAY + timedelta(days=1)
@@ -0,0 +1,38 @@
+# tests/test_stats_cache.py
+"""
+Юнит-тесты кэша /stats/overview (backend/app/routers/stats.py, chunk1-7): TTL и LRU.
+"""
+
+from collections import OrderedDict
+
+import pytest
+
+from backend.app.routers import stats
+
+
+@pytest.fixture(autouse=True)
+def empty_cache(monkeypatch):
+    monkeypatch.setattr(stats, "STATS_CACHE", OrderedDict())
+
+
+def test_entry_expires_and_is_dropped():
+    stats._stats_cache_set("u1", b"{}", expires_at=10.0)
+    assert stats._stats_cache_get("u1", now=9.0) == b"{}"
+    assert stats._stats_cache_get("u1", now=10.0) is None
+    assert "u1" not in stats.STATS_CACHE
+
+
+def test_cache_is_bounded_lru(monkeypatch):
+    monkeypatch.setattr(stats, "STATS_CACHE_MAXSIZE", 2)
+    stats._stats_cache_set("a", b"a", expires_at=100.0)
+    stats._stats_cache_set("b", b"b", expires_at=100.0)
+    stats._stats_cache_get("a", now=0.0)  # a свежее b
+    stats._stats_cache_set("c", b"c", expires_at=100.0)
+
+    assert list(stats.STATS_CACHE) == ["a", "c"]
+
+
+def test_invalidate_stats():
+    stats._stats_cache_set("u1", b"{}", expires_at=100.0)
+    stats.invalidate_stats("u1")
+    assert stats._stats_cache_get("u1", now=0.0) is None